@@ -4,18 +4,35 @@ creates build files for ninja.
 """
 #! /usr/bin/env python3
 import argparse
+import bisect
+import fnmatch
+import hashlib
+import importlib.util
+import io
 import os
+import re
+import shlex
 import shutil
+import subprocess
 import sys
+import time
 import json
-import re
 from pathlib import Path
-from typing import Dict, List, Set, Union
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Set, Union
 
 import ninja_syntax
-import splat
-import splat.scripts.split as split
-from splat.segtypes.linker_entry import LinkerEntry
+
+if TYPE_CHECKING:
+    from splat.segtypes.linker_entry import LinkerEntry
+
+# splat is imported by import_splat(), only when the build model has to be derived again
+splat = None
+split = None
+splat_options = None
+splat_symbols = None
+
+# The scripts in tools/ double as modules; like splat, they're imported where they're used
+sys.path.insert(0, str(Path(__file__).parent.resolve() / "tools"))
 
 #MARK: Constants
 ROOT = Path(__file__).parent.resolve()
@@ -23,11 +40,40 @@ TOOLS_DIR = ROOT / "tools"
 OUTDIR = "out"
 
 YAML_FILE = Path("config/sonic.yaml")
+SYMBOL_ADDRS_PATH = Path("config/symbol_addrs.txt")
+SPLIT_MANIFEST_PATH = Path(".splat_manifest.json")
+SYMTAB_CACHE_PATH = Path(".symtab_cache.json")
+SNAPSHOT_PATH = Path(".configure_snapshot.json")
+SNAPSHOT_VERSION = 2
+SRC_DIR = Path("src")
+SRC_SUFFIXES = (".cpp", ".c")
 BASENAME = "SLUS_216.42"
 LD_PATH = f"{BASENAME}.splat.ld"
 ELF_PATH = f"{OUTDIR}/{BASENAME}"
 MAP_PATH = f"{OUTDIR}/{BASENAME}.map"
 PRE_ELF_PATH = f"{OUTDIR}/{BASENAME}.elf"
+LOADABLE_PATH = f"{OUTDIR}/{BASENAME}.loadable"
+NINJA_PATH = "build.ninja"
+CONFIGURE_DEPFILE_PATH = f"{NINJA_PATH}.d"
+OBJDIFF_PATH = "objdiff.json"
+PERMUTER_SETTINGS_PATH = "permuter_settings.toml"
+REFERENCE_DIR = Path("build/ref")
+REFERENCE_MANIFEST_PATH = REFERENCE_DIR / "manifest.json"
+REFERENCE_LD_PATH = (REFERENCE_DIR / LD_PATH).as_posix()
+SHORT_LOOP_DIR = Path("build/shortloop")
+SHORT_LOOP_STATE_PATH = SHORT_LOOP_DIR / "state.json"
+PATCH_LINK_STATE_PATH = f"{OUTDIR}/{BASENAME}.patchlink.json"
+VERIFY_PATH = f"{OUTDIR}/{BASENAME}.verify.json"
+PROFILE_DIR = Path("build/profile")
+PROFILE_PATH = PROFILE_DIR / "configure.json"
+# The packages the split runs on: splat, and spimdisasm and rabbitizer, which disassemble for it
+SPLIT_PACKAGES = ["splat", "spimdisasm", "rabbitizer"]
+# The tools configure.py imports or runs, which build.ninja is regenerated on as well
+CONFIGURE_TOOLS = ["depscan.py", "elffile.py", "loopscan.py", "shortloop.py", "symtab.py"]
+TARGET_PATH = f"disc/{BASENAME}"
+
+# An object's input sections in the linker script, e.g. build/asm/foo.s.o(.text)
+LINKER_OBJECT_PATTERN = re.compile(r"(\S+\.o)\(")
 
 COMMON_INCLUDES = "-i include -i include/sdk/ee -i include/gcc"
 
@@ -41,6 +87,27 @@ COMPILE_CMD = f"{GAME_MWCC_CMD}"
 if sys.platform == "linux" or sys.platform == "linux2":
     COMPILE_CMD = f"{WINE} {GAME_MWCC_CMD}"
 
+# Thin client for tools/mwcc_server.py, which runs the same wine command against a persistent wineserver
+COMPILE_SERVER_CMD = f"{sys.executable} {TOOLS_DIR}/mwcc_server.py cc -- {GAME_MWCC_CMD}"
+
+# Writes the cc rule's depfile, following #include and INCLUDE_ASM
+DEPSCAN_CMD = f"{sys.executable} {TOOLS_DIR}/depscan.py {COMMON_INCLUDES}"
+
+# Patches changed objects into the last full link's image, see tools/patchlink.py
+PATCH_LINK_CMD = f"{sys.executable} {TOOLS_DIR}/patchlink.py"
+
+# Per-section/unit/symbol comparison against the original binary, see tools/verify.py
+VERIFY_CMD = f"{sys.executable} {TOOLS_DIR}/verify.py"
+
+# Copies the non-loadable tail of the original binary into the image, see tools/splice.py
+SPLICE_CMD = f"{sys.executable} {TOOLS_DIR}/splice.py"
+
+# Branch-to-opcode patch for functions hit by the short loop bug, see tools/shortloop.py
+SHORT_LOOP_CMD = f"{sys.executable} {TOOLS_DIR}/shortloop.py"
+
+# Wrapper for tools/objcache.py, which needs to know the compiler binary to key on it
+OBJECT_CACHE_CMD = f"{sys.executable} {TOOLS_DIR}/objcache.py"
+
 CATEGORY_MAP = {
     "P2": "Engine",
     "splice": "Splice",
@@ -56,9 +123,13 @@ def clean():
     files_to_clean = [
         ".splache",
         ".ninja_log",
-        "build.ninja",
-        "permuter_settings.toml",
-        "objdiff.json",
+        NINJA_PATH,
+        CONFIGURE_DEPFILE_PATH,
+        PERMUTER_SETTINGS_PATH,
+        OBJDIFF_PATH,
+        str(SPLIT_MANIFEST_PATH),
+        str(SYMTAB_CACHE_PATH),
+        str(SNAPSHOT_PATH),
         LD_PATH
     ]
     for filename in files_to_clean:
@@ -72,12 +143,27 @@ def clean():
     shutil.rmtree("build", ignore_errors=True)
 
 
+def write_if_changed(path: Union[str, Path], content: str) -> bool:
+    """
+    Write content to path unless it already holds exactly that, so unchanged outputs keep
+    their mtimes and don't trigger relinks or objdiff reloads. Returns whether it wrote.
+    """
+    path = Path(path)
+    try:
+        if path.read_text(encoding="utf-8") == content:
+            return False
+    except OSError:
+        pass
+    with path.open("w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+
 def write_permuter_settings():
     """
     Write the permuter settings file, comprising the compiler and assembler commands.
     """
-    with open("permuter_settings.toml", "w", encoding="utf-8") as f:
-        f.write(f"""compiler_command = "{COMPILE_CMD} -D__GNUC__"
+    write_if_changed(PERMUTER_SETTINGS_PATH, f"""compiler_command = "{COMPILE_CMD} -D__GNUC__"
 assembler_command = "mips-linux-gnu-as -march=r5900 -mabi=eabi -Iinclude"
 compiler_type = "mwcc"
 
@@ -87,15 +173,437 @@ compiler_type = "mwcc"
 "tools/build/cc/mwcc/mwccps2" = "mwcps2-3.0.1b145"
 """)
 
+
+def write_objdiff(units: List[Dict]):
+    """
+    Write objdiff.json for the given units.
+    """
+    objdiff = {
+        "$schema": "https://raw.githubusercontent.com/encounter/objdiff/main/config.schema.json",
+        "custom_make": "ninja",
+        "custom_args": [],
+        "build_target": False,
+        "build_base": True,
+        "watch_patterns": [
+            "src/**/*.c",
+            "src/**/*.cp",
+            "src/**/*.cpp",
+            "src/**/*.cxx",
+            "src/**/*.h",
+            "src/**/*.hp",
+            "src/**/*.hpp",
+            "src/**/*.hxx",
+            "src/**/*.s",
+            "src/**/*.S",
+            "src/**/*.asm",
+            "src/**/*.inc",
+            "src/**/*.py",
+            "src/**/*.yml",
+            "src/**/*.txt",
+            "src/**/*.json"
+        ],
+        "units": units,
+        "progress_categories": [ {"id": id, "name": name} for id, name in CATEGORY_MAP.items() ],
+    }
+    write_if_changed(OBJDIFF_PATH, json.dumps(objdiff, indent=2))
+
+#MARK: Profile
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak RSS isn't reported
+    resource = None
+
+
+class Profiler:
+    """
+    Records the wall time, CPU time (including child processes) and peak RSS of consecutive
+    configure phases, and the unit and categories of each edge, for tools/buildprof.py.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.phases: List[Dict] = []
+        self.units: Dict[str, Dict] = {}
+        self.current: Optional[Dict] = None
+
+    @staticmethod
+    def cpu_seconds() -> float:
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    @staticmethod
+    def peak_rss_kib() -> Optional[int]:
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, KiB elsewhere
+        return peak // 1024 if sys.platform == "darwin" else peak
+
+    def start(self, name: str):
+        """
+        End the current phase, if any, and start the next one.
+        """
+        self.stop()
+        self.current = {"name": name, "start": time.perf_counter(), "cpu": self.cpu_seconds()}
+
+    def stop(self):
+        if self.current is None:
+            return
+        now = time.perf_counter()
+        self.phases.append({
+            "name": self.current["name"],
+            "start_ms": round((self.current["start"] - self.origin) * 1000, 3),
+            "wall_ms": round((now - self.current["start"]) * 1000, 3),
+            "cpu_ms": round((self.cpu_seconds() - self.current["cpu"]) * 1000, 3),
+            "peak_rss_kib": self.peak_rss_kib(),
+        })
+        self.current = None
+
+    def record_unit(self, output: Union[str, Path], name: str):
+        self.units[Path(output).as_posix()] = {"unit": name, "categories": unit_categories(name)}
+
+    def write(self, path: Path):
+        self.stop()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            json.dump({"phases": self.phases, "units": self.units, "categories": CATEGORY_MAP}, f, indent=2)
+
+
+PROFILER = Profiler()
+
+#MARK: Symbols
+def refresh_symbols(check=False):
+    """
+    Refresh the extracted block of symbol_addrs.txt from the original binary's symtab and report
+    hand-written entries that drifted from it. The extraction is cached on the binary's sha1.
+    """
+    command = [
+        sys.executable, str(TOOLS_DIR / "symtab.py"),
+        "--binary", TARGET_PATH,
+        "--symbol-addrs", str(SYMBOL_ADDRS_PATH),
+        "--cache", str(SYMTAB_CACHE_PATH),
+    ]
+    if check:
+        command.append("--check")
+    subprocess.run(command, check=True)
+
+#MARK: Split
+def import_splat():
+    """
+    Import splat, which alone takes longer than a configure served from the snapshot.
+    """
+    global splat, split, splat_options, splat_symbols
+    import splat
+    import splat.scripts.split as split
+    import splat.util.options as splat_options
+    import splat.util.symbols as splat_symbols
+
+
+def iter_leaf_segments(segments):
+    """
+    Yield every segment that has no subsegments, depth first.
+    """
+    for seg in segments:
+        subsegments = getattr(seg, "subsegments", None)
+        if subsegments:
+            yield from iter_leaf_segments(subsegments)
+        else:
+            yield seg
+
+
+def split_common_key() -> str:
+    """
+    Hash the inputs that affect every segment: splat version, yaml options and symbol_addrs.txt.
+    """
+    h = hashlib.sha1()
+    h.update(str(getattr(splat, "__version__", "")).encode())
+    h.update(json.dumps(split.config.get("options"), sort_keys=True, default=str).encode())
+    if SYMBOL_ADDRS_PATH.exists():
+        h.update(SYMBOL_ADDRS_PATH.read_bytes())
+    return h.hexdigest()
+
+
+def segment_key(seg, common_key: str) -> str:
+    """
+    Hash a segment's yaml entry and byte range together with the common key.
+    """
+    h = hashlib.sha1(common_key.encode())
+    h.update(json.dumps(seg.yaml, sort_keys=True, default=str).encode())
+    h.update(f"{seg.rom_start}:{seg.rom_end}".encode())
+    return h.hexdigest()
+
+
+def split_incremental():
+    """
+    Run splat, but only split the segments whose manifest key changed since the last run.
+    Every segment is still scanned so symbol resolution sees the whole binary; unchanged
+    segments just skip writing their files, which keeps their mtimes stable for ninja.
+    """
+    try:
+        with SPLIT_MANIFEST_PATH.open("r", encoding="utf-8") as f:
+            old_keys = json.load(f)
+    except (OSError, ValueError):
+        old_keys = {}
+
+    new_keys: Dict[str, str] = {}
+    do_split = split.do_split
+
+    def skip_split(rom_bytes):
+        pass
+
+    def do_split_incremental(all_segments, *args, **kwargs):
+        common_key = split_common_key()
+        resplit = 0
+        for seg in iter_leaf_segments(all_segments):
+            seg_id = seg.unique_id()
+            key = segment_key(seg, common_key)
+            new_keys[seg_id] = key
+
+            out_path = seg.out_path()
+            if old_keys.get(seg_id) == key and (out_path is None or out_path.exists()):
+                seg.split = skip_split
+            else:
+                resplit += 1
+        print(f"Incremental split: {resplit} of {len(new_keys)} segments changed")
+        do_split(all_segments, *args, **kwargs)
+
+    split.do_split = do_split_incremental
+    try:
+        split.main([YAML_FILE], modes="all", verbose=False, use_cache=False)
+    finally:
+        split.do_split = do_split
+
+    with SPLIT_MANIFEST_PATH.open("w", encoding="utf-8") as f:
+        json.dump(new_keys, f, indent=2, sort_keys=True)
+
+#MARK: Splice
+def splice_segments():
+    """
+    Take the trailing top-level databin segments (symtab, strtab, debug, line, ...) out of the
+    split and the linker script, so they're spliced in from the original binary instead of
+    going through as and ld. Returns the rom range they cover, filled in once splat has run.
+    """
+    splice_range: List[int] = []
+    spliced = []
+    initialize_segments = split.initialize_segments
+    write_linker_script = split.write_linker_script
+
+    def skip_split(rom_bytes):
+        pass
+
+    def initialize_segments_spliced(*args, **kwargs):
+        all_segments = initialize_segments(*args, **kwargs)
+        trailing = []
+        for seg in reversed(all_segments):
+            if seg.type != "databin":
+                break
+            trailing.append(seg)
+        trailing.reverse()
+        # The image has to start with something linked, so the first segment is never spliced
+        trailing = [seg for seg in trailing if seg is not all_segments[0]]
+
+        for seg in trailing:
+            seg.split = skip_split
+        spliced[:] = trailing
+        if trailing:
+            splice_range[:] = [trailing[0].rom_start, trailing[-1].rom_end]
+            print(f"Splicing {len(trailing)} segments (0x{splice_range[0]:X}-0x{splice_range[1]:X}) from the original binary")
+        return all_segments
+
+    def write_linker_script_spliced(all_segments):
+        return write_linker_script([seg for seg in all_segments if seg not in spliced])
+
+    split.initialize_segments = initialize_segments_spliced
+    split.write_linker_script = write_linker_script_spliced
+    return splice_range
+
+#MARK: Sources
+def index_sources(src_dir: Path):
+    """
+    Walk src_dir once and index its C/C++ files by stem and by path relative to src_dir (without suffix).
+    Also returns the directories walked, whose mtimes change when files are added or removed.
+    """
+    files: List[Path] = []
+    dirs: List[Path] = []
+    by_stem: Dict[str, List[Path]] = {}
+    by_rel: Dict[str, Path] = {}
+
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames.sort()
+        dirs.append(Path(dirpath))
+        for filename in sorted(filenames):
+            path = Path(dirpath) / filename
+            if path.suffix not in SRC_SUFFIXES:
+                continue
+            files.append(path)
+            by_stem.setdefault(path.stem, []).append(path)
+            by_rel.setdefault(path.relative_to(src_dir).with_suffix("").as_posix(), path)
+
+    return files, by_stem, by_rel, dirs
+
+#MARK: Units
+def linked_object_path(obj: Path, src: Optional[Path]) -> Path:
+    """
+    Return where the object linked for a source is built, based on the source's location.
+    """
+    if src:
+        src_parts = src.parts
+        # Check if source is from asm/ or src/
+        if src_parts[0] == "asm":
+            # Assembly file: build/obj/ + rest of path
+            relative_path = Path(*src_parts[1:])
+            return Path("build") / "obj" / relative_path.with_suffix(".o")
+        elif src_parts[0] == "src":
+            # C/C++ file: build/src/ + rest of path
+            relative_path = Path(*src_parts[1:])
+            return Path("build") / "src" / relative_path.with_suffix(".o")
+        # Fallback: use original path structure
+        return Path("build") / obj.with_suffix(".o")
+    # No source path, use original
+    return Path("build") / obj.with_suffix(".o")
+
+
+def unit_rel_path(src: Path) -> Path:
+    """
+    Return a source's path without its asm/ or src/ prefix, the same for a unit before and after matching.
+    """
+    if src.parts and src.parts[0] in ("asm", "src"):
+        return Path(*src.parts[1:])
+    return src
+
+
+def unit_categories(name: str) -> List[str]:
+    """
+    Return the objdiff progress categories of a unit.
+    """
+    categories = [name.split("/")[0]]
+    if "P2/splice/" in name:
+        categories.append("splice")
+    elif "P2/ps2t" in name:
+        categories.append("ps2t")
+    return categories
+
+
+def unit_selected(name: str, patterns: List[str]) -> bool:
+    """
+    Check a unit name against --only patterns. A pattern matches a unit if it's one of the unit's
+    categories, one of the directories in its path, a glob matching the name, or a path prefix of it.
+    """
+    directories = name.split("/")[:-1]
+    for pattern in patterns:
+        pattern = pattern.rstrip("/")
+        if pattern in unit_categories(name) or pattern in directories:
+            return True
+        if fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(name, pattern + "/*"):
+            return True
+    return False
+
+def reference_linker_script(reference_objects: Dict[str, str]) -> str:
+    """
+    Return splat's linker script with the objects of the units outside the --only selection
+    replaced by their reference objects.
+    """
+    script = Path(LD_PATH).read_text(encoding="utf-8")
+    return LINKER_OBJECT_PATTERN.sub(lambda m: reference_objects.get(m.group(1), m.group(1)) + "(", script)
+
+#MARK: Model
+class BuildEntry(NamedTuple):
+    """
+    What the graph needs of one of splat's linker entries, so it can be rebuilt from the
+    snapshot without splat. key is the segment's manifest key, which --only reference objects
+    are rebuilt on.
+    """
+    segment_id: str
+    segment_type: str
+    task: str
+    object_path: Path
+    src_paths: List[Path]
+    key: str
+
+
+def build_model(linker_entries: List["LinkerEntry"], common_key: str) -> List[BuildEntry]:
+    """
+    Reduce splat's linker entries to the build model: the rule and paths of every entry that
+    builds an object.
+    """
+    model = []
+    for entry in linker_entries:
+        seg = entry.segment
+
+        if seg.type[0] == ".":
+            continue
+
+        if entry.object_path is None:
+            continue
+
+        if isinstance(seg, splat.segtypes.common.asm.CommonSegAsm) or isinstance(
+            seg, splat.segtypes.common.data.CommonSegData
+        ):
+            task = "as"
+        elif isinstance(seg, splat.segtypes.common.c.CommonSegC):
+            task = "cc"
+        elif isinstance(seg, splat.segtypes.common.databin.CommonSegDatabin):
+            task = "as"
+        elif isinstance(seg, splat.segtypes.common.rodatabin.CommonSegRodatabin):
+            task = "as"
+        elif isinstance(seg, splat.segtypes.common.textbin.CommonSegTextbin):
+            task = "as"
+        elif isinstance(seg, splat.segtypes.common.bin.CommonSegBin):
+            task = "as"
+        else:
+            print(f"ERROR: Unsupported build segment type {seg.type}")
+            sys.exit(1)
+
+        model.append(BuildEntry(
+            seg.unique_id(),
+            seg.type,
+            task,
+            Path(entry.object_path),
+            [Path(s) for s in entry.src_paths],
+            segment_key(seg, common_key),
+        ))
+    return model
+
 #MARK: Build
-def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_only=False, dual_objects=False):
+def build_stuff(model: List[BuildEntry], skip_checksum=False, objects_only=False, dual_objects=False, compile_server=False, object_cache=False, patch_link=False, splice_range=None, configure_args=None, only=None, short_loop=None):
     """
-    Build the objects and the final ELF file.
+    Build the objects and the final ELF file from the build model.
     If objects_only is True, only build objects and skip linking/checksum.
-    If dual_objects is True, build objects twice: once normally, once with -DSKIP_ASM.
+    If dual_objects is True, also build obj/target and obj/current (with -DSKIP_ASM) objects for objdiff.
+    If compile_server is True, compile through tools/mwcc_server.py instead of invoking wine directly.
+    If object_cache is True, run the cc and as rules through tools/objcache.py.
+    If patch_link is True, link through tools/patchlink.py, which only relinks fully when layouts shift.
+    If splice_range is given, the linked image stops at its start and tools/splice.py copies the
+    range from the original binary.
+    configure_args are the arguments ninja reruns configure.py with when its inputs change.
+    If only is given, just the units matching those patterns are built; the rest link against
+    reference objects in build/ref, through a copy of the linker script that names them.
+    short_loop maps C segments to the asm files tools/shortloop.py patches for them.
+    Returns the units written to objdiff.json, or None if it wasn't written.
     """
-    built_objects: Set[Path] = set()
+    PROFILER.start("index sources")
+    built_objects: Dict[Path, None] = {}  # Ordered, so the link line is stable
+    built_sources: Set[Path] = set()
     objdiff_units = []  # For objdiff.json
+    src_files, src_by_stem, src_by_rel, src_dirs = index_sources(SRC_DIR)
+
+    if short_loop is None:
+        short_loop = {}
+
+    reference_keys: Dict[str, str] = {}
+    reference_objects: Dict[str, str] = {}  # Object the linker script names -> reference object
+    link_script = LD_PATH
+    if only:
+        import depscan
+
+        try:
+            with REFERENCE_MANIFEST_PATH.open("r", encoding="utf-8") as f:
+                old_reference_keys = json.load(f)
+        except (OSError, ValueError):
+            old_reference_keys = {}
+        include_dirs = depscan.parse_include_dirs(COMMON_INCLUDES.split())
+        scan_cache: Dict[Path, List[Path]] = {}
+        link_script = REFERENCE_LD_PATH
 
     def build(
         object_paths: Union[Path, List[Path]],
@@ -107,9 +615,12 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
         extra_flags: str = "",
         collect_objdiff: bool = False,
         orig_entry=None,
+        inputs: List[Path] = None,
+        implicit: List[str] = None,
     ):
         """
-        Helper function to build objects.
+        Helper function to build objects. Returns the object paths it emitted edges for.
+        If inputs is given, the edges read those files instead of src_paths (e.g. for copies).
         """
         # Handle none parameters
         if variables is None:
@@ -142,34 +653,19 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
             # Regular build mode: determine path based on source location
             new_object_paths = []
             for idx, obj in enumerate(object_paths):
-                obj = Path(obj)
                 src = Path(src_paths[idx]) if idx < len(src_paths) else None
-                
-                if src:
-                    src_parts = src.parts
-                    # Check if source is from asm/ or src/
-                    if src_parts[0] == "asm":
-                        # Assembly file: build/obj/ + rest of path
-                        relative_path = Path(*src_parts[1:])
-                        new_obj = Path("build") / "obj" / relative_path.with_suffix(".o")
-                    elif src_parts[0] == "src":
-                        # C/C++ file: build/src/ + rest of path
-                        relative_path = Path(*src_parts[1:])
-                        new_obj = Path("build") / "src" / relative_path.with_suffix(".o")
-                    else:
-                        # Fallback: use original path structure
-                        new_obj = Path("build") / obj.with_suffix(".o")
-                else:
-                    # No source path, use original
-                    new_obj = Path("build") / obj.with_suffix(".o")
-                
-                new_object_paths.append(new_obj)
+                new_object_paths.append(linked_object_path(Path(obj), src))
             object_paths = new_object_paths
+            built_sources.update(Path(s) for s in src_paths)
 
-        # Add object paths to built_objects
+        # Add object paths to built_objects, which the linker takes
         for idx, object_path in enumerate(object_paths):
-            if object_path.suffix == ".o":
-                built_objects.add(object_path)
+            if object_path.suffix == ".o" and not out_dir:
+                built_objects[object_path] = None
+
+            edge_inputs = [str(s) for s in src_paths]
+            if inputs is not None:
+                edge_inputs = [str(inputs[idx])]
 
             # Add extra_flags to variables if present
             build_vars = variables.copy()
@@ -178,29 +674,21 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
             ninja.build(
                 outputs=[str(object_path)],
                 rule=task,
-                inputs=[str(s) for s in src_paths],
+                inputs=edge_inputs,
                 variables=build_vars,
+                implicit=implicit,
                 implicit_outputs=implicit_outputs,
             )
+            if src_paths:
+                PROFILER.record_unit(object_path, unit_rel_path(Path(src_paths[0])).with_suffix("").as_posix())
 
             # Collect for objdiff.json if requested
             if collect_objdiff and orig_entry is not None:
                 src = src_paths[0] if src_paths else None
                 if src:
-                    src = Path(src)
                     # Always use the final "matched" name, i.e. as if it will be in src/ with no asm/ prefix
-                    try:
-                        # If the file is in asm/, replace asm/ with nothing (just drop asm/)
-                        if src.parts[0] == "asm":
-                            rel = Path(*src.parts[1:])
-                        elif src.parts[0] == "src":
-                            rel = Path(*src.parts[1:])
-                        else:
-                            rel = src
-                        # Remove extension for the name
-                        name = str(rel.with_suffix(""))
-                    except Exception:
-                        name = str(src.with_suffix(""))
+                    rel = unit_rel_path(Path(src))
+                    name = rel.with_suffix("").as_posix()
                 else:
                     name = object_path.stem
                     # Ensure `rel` is defined so later code can compute src-based paths
@@ -217,24 +705,19 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
                     # Regular mode: target is in build/obj/
                     target_path = str(Path("build") / "obj" / rel.with_suffix(".o"))
 
-                # Determine if a .c or .cpp file exists in src/ for this unit (recursively)
+                # Determine if a .c or .cpp file exists in src/ for this unit, preferring
+                # the same relative path and falling back to a file with the same stem
                 src_base = rel.with_suffix("")
-                src_c_files = list(Path("src").rglob(src_base.name + ".c"))
-                src_cpp_files = list(Path("src").rglob(src_base.name + ".cpp"))
-                has_src = bool(src_c_files or src_cpp_files)
-
-                # Determine the category based on the name
-                categories = [name.split("/")[0]]
-                if "P2/splice/" in name:
-                    categories.append("splice")
-                elif "P2/ps2t" in name:
-                    categories.append("ps2t")
+                src_file = src_by_rel.get(src_base.as_posix())
+                if src_file is None and src_base.name in src_by_stem:
+                    src_file = src_by_stem[src_base.name][0]
+                has_src = src_file is not None
 
                 unit = {
                     "name": name,
                     "target_path": target_path,
                     "metadata": {
-                        "progress_categories": categories,
+                        "progress_categories": unit_categories(name),
                     }
                 }
 
@@ -250,11 +733,70 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
                         base_path = str(Path(*parts))
                     else:
                         # Regular mode: base is in build/src/
-                        base_path = str(Path("build") / "src" / rel.with_suffix(".o"))
+                        base_path = str(Path("build") / "src" / src_file.relative_to(SRC_DIR).with_suffix(".o"))
                     unit["base_path"] = base_path
                 objdiff_units.append(unit)
 
-    ninja = ninja_syntax.Writer(open(str(ROOT / "build.ninja"), "w", encoding="utf-8"), width=9999)
+        return object_paths
+
+    def build_reference(entry, task: str):
+        """
+        Link a unit outside the --only selection against its reference object in build/ref,
+        which survives switching selections. The object is keyed on its segment and every file
+        the unit pulls in; a stale one is removed, so it's rebuilt even if mtimes say otherwise.
+        """
+        ref = REFERENCE_DIR / unit_rel_path(Path(entry.src_paths[0])).with_suffix(".o")
+        h = hashlib.sha1(entry.key.encode())
+        deps = depscan.scan(entry.src_paths, include_dirs, scan_cache)
+        # The short loop patched asm is regenerated from its pristine copy
+        deps += [SHORT_LOOP_DIR / p for p in short_loop.get(entry.segment_id, [])]
+        for dep in deps:
+            if dep.is_file():
+                h.update(dep.as_posix().encode() + b"\0" + dep.read_bytes())
+        key = h.hexdigest()
+
+        reference_keys[ref.as_posix()] = key
+        reference_objects[entry.object_path.as_posix()] = ref.as_posix()
+        built_objects[ref] = None
+        if ref.exists() and old_reference_keys.get(ref.as_posix()) != key:
+            ref.unlink()
+
+        # Always emitted, so ninja also rebuilds it for edits made without rerunning configure
+        ninja.build(
+            outputs=[ref.as_posix()],
+            rule=task,
+            inputs=[str(s) for s in entry.src_paths],
+            implicit=[p.as_posix() for p in short_loop.get(entry.segment_id, [])],
+        )
+        PROFILER.record_unit(ref, unit_rel_path(Path(entry.src_paths[0])).with_suffix("").as_posix())
+
+    def build_segment(entry, task: str):
+        """
+        Build a segment's object for the link and, if dual_objects, its obj/target and obj/current variants.
+        """
+        if only and not unit_selected(unit_rel_path(Path(entry.src_paths[0])).with_suffix("").as_posix(), only):
+            build_reference(entry, task)
+            return
+
+        # Make sure the patched asm the unit includes is in place before it's compiled
+        implicit = [p.as_posix() for p in short_loop.get(entry.segment_id, [])]
+
+        if not dual_objects:
+            build(entry.object_path, entry.src_paths, task, collect_objdiff=True, orig_entry=entry, implicit=implicit)
+            return
+
+        # The target object is the same as the linked one, so it's a copy rather than a rebuild
+        objects = build(entry.object_path, entry.src_paths, task, implicit=implicit)
+        build(entry.object_path, entry.src_paths, "copy", out_dir="obj/target", collect_objdiff=True, orig_entry=entry, inputs=objects)
+        if task == "as":
+            # The as rule ignores $cflags, so the -DSKIP_ASM variant is identical too
+            build(entry.object_path, entry.src_paths, "copy", out_dir="obj/current", inputs=objects)
+        else:
+            build(entry.object_path, entry.src_paths, "cc", out_dir="obj/current", extra_flags="-DSKIP_ASM")
+
+    PROFILER.start("rules")
+    ninja_out = io.StringIO()
+    ninja = ninja_syntax.Writer(ninja_out, width=9999)
 
     #MARK: Rules
     cross = "mips-linux-gnu-"
@@ -268,16 +810,45 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
 
     ld_args = "-EL -T config/undefined_syms_auto.txt -T config/undefined_funcs_auto.txt -Map $mapfile -T $in -o $out"
 
+    as_cmd = f"{cross_path}as -no-pad-sections -EL -march=5900 -mabi=eabi -Iinclude --MD $out.d -o $out $in"
+    compile_cmd = COMPILE_CMD
+    if compile_server:
+        compile_cmd = COMPILE_SERVER_CMD
+
+    if object_cache:
+        as_cmd = f"{OBJECT_CACHE_CMD} --compiler {cross_path}as -- {as_cmd}"
+        compile_cmd = f"{OBJECT_CACHE_CMD} --compiler {CC_DIR}/mwccps2 -- {compile_cmd}"
+
     ninja.rule(
         "as",
         description="as $in",
-        command=f"{cross_path}as -no-pad-sections -EL -march=5900 -mabi=eabi -Iinclude -o $out $in",
+        command=as_cmd,
+        depfile="$out.d",
+        deps="gcc",
     )
 
+    cc_cmd = f"{compile_cmd} $cflags -o $out && {DEPSCAN_CMD} -o $out.d -t $out $in"
+    if sys.platform == "win32":
+        # ninja runs commands without a shell on Windows, so && needs cmd
+        cc_cmd = f"cmd /c {cc_cmd}"
+
     ninja.rule(
         "cc",
         description="cc $in",
-        command=f"{COMPILE_CMD} $cflags -o $out",
+        command=cc_cmd,
+        depfile="$out.d",
+        deps="gcc",
+    )
+
+    if sys.platform == "win32":
+        copy_cmd = f"{sys.executable} -c \"import shutil, sys; shutil.copyfile(sys.argv[1], sys.argv[2])\" $in $out"
+    else:
+        copy_cmd = "ln -f $in $out"
+
+    ninja.rule(
+        "copy",
+        description="copy $out",
+        command=copy_cmd,
     )
 
     ninja.rule(
@@ -286,6 +857,36 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
         command=f"{cross_path}ld {ld_args}",
     )
 
+    # With splicing, the link produces the loadable part of the image and the splice step the rest
+    linked_path = LOADABLE_PATH if splice_range else ELF_PATH
+
+    full_ld_cmd = f"{cross_path}ld {ld_args}".replace("$mapfile", MAP_PATH).replace("$in", link_script).replace("$out", PRE_ELF_PATH)
+    full_elf_cmd = f"{cross_path}objcopy {PRE_ELF_PATH} {linked_path} -O binary"
+    ninja.rule(
+        "patchlink",
+        description="patch link $out",
+        command=f"{PATCH_LINK_CMD} --state {PATCH_LINK_STATE_PATH} --map $mapfile --elf {PRE_ELF_PATH} --script $in --out $out --ld \"{full_ld_cmd}\" --objcopy \"{full_elf_cmd}\"",
+    )
+
+    ninja.rule(
+        "splice",
+        description="splice $out",
+        command=f"{SPLICE_CMD} --target {TARGET_PATH} --start $start --end $end $in $out",
+    )
+
+    ninja.rule(
+        "shortloop",
+        description="shortloop $out",
+        command=f"{SHORT_LOOP_CMD} --hash $hash $in $out",
+        restat=True,
+    )
+
+    ninja.rule(
+        "verify",
+        description="verify $in",
+        command=f"{VERIFY_CMD} --target {TARGET_PATH} --built $in --map {MAP_PATH} --yaml {YAML_FILE} -o $out",
+    )
+
     ninja.rule(
         "sha1sum",
         description="sha1sum $in",
@@ -298,147 +899,126 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
         command=f"{cross_path}objcopy $in $out -O binary",
     )
 
-    #MARK: Build
-    # Build all the objects
-    for entry in linker_entries:
-        seg = entry.segment
+    #MARK: Configure
+    # Rerun configure.py when the yaml, the symbols, the script itself, the tools it imports or the
+    # set of files under src/ changes. restat stops ninja from looping when build.ninja comes out unchanged.
+    if configure_args is not None:
+        ninja.rule(
+            "configure",
+            description="configure",
+            command=f"{sys.executable} configure.py {shlex.join(configure_args)}".rstrip(),
+            depfile=CONFIGURE_DEPFILE_PATH,
+            generator=True,
+            restat=True,
+        )
 
-        if seg.type[0] == ".":
-            continue
+        configure_inputs = ["configure.py", str(YAML_FILE)]
+        configure_inputs += [f"tools/{name}" for name in CONFIGURE_TOOLS]
+        if SYMBOL_ADDRS_PATH.exists():
+            configure_inputs.append(str(SYMBOL_ADDRS_PATH))
+        ninja.build(
+            NINJA_PATH,
+            "configure",
+            implicit=configure_inputs,
+        )
 
-        if entry.object_path is None:
-            continue
+        dirs = " ".join(d.as_posix().replace(" ", "\\ ") for d in src_dirs)
+        write_if_changed(CONFIGURE_DEPFILE_PATH, f"{NINJA_PATH}: {dirs}\n")
 
-        if isinstance(seg, splat.segtypes.common.asm.CommonSegAsm) or isinstance(
-            seg, splat.segtypes.common.data.CommonSegData
-        ):
-            if dual_objects:
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/target", collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/current", extra_flags="-DSKIP_ASM")
-            else:
-                build(entry.object_path, entry.src_paths, "as", collect_objdiff=True, orig_entry=entry)
-        elif isinstance(seg, splat.segtypes.common.c.CommonSegC):
-            if dual_objects:
-                build(entry.object_path, entry.src_paths, "cc", out_dir="obj/target", collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "cc", out_dir="obj/current", extra_flags="-DSKIP_ASM")
-            else:
-                build(entry.object_path, entry.src_paths, "cc", collect_objdiff=True, orig_entry=entry)
-        elif isinstance(seg, splat.segtypes.common.databin.CommonSegDatabin):
-            if dual_objects:
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/target", collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/current", extra_flags="-DSKIP_ASM")
-            else:
-                build(entry.object_path, entry.src_paths, "as", collect_objdiff=True, orig_entry=entry)
-        elif isinstance(seg, splat.segtypes.common.rodatabin.CommonSegRodatabin):
-            if dual_objects:
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/target", collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/current", extra_flags="-DSKIP_ASM")
-            else:
-                build(entry.object_path, entry.src_paths, "as", collect_objdiff=True, orig_entry=entry)
-        elif isinstance(seg, splat.segtypes.common.textbin.CommonSegTextbin):
-            if dual_objects:
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/target", collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/current", extra_flags="-DSKIP_ASM")
-            else:
-                build(entry.object_path, entry.src_paths, "as", collect_objdiff=True, orig_entry=entry)
-        elif isinstance(seg, splat.segtypes.common.bin.CommonSegBin):
-            if dual_objects:
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/target", collect_objdiff=True, orig_entry=entry)
-                build(entry.object_path, entry.src_paths, "as", out_dir="obj/current", extra_flags="-DSKIP_ASM")
-            else:
-                build(entry.object_path, entry.src_paths, "as", collect_objdiff=True, orig_entry=entry)
-        else:
-            print(f"ERROR: Unsupported build segment type {seg.type}")
-            sys.exit(1)
+    #MARK: Build
+    PROFILER.start("graph")
 
-    # Scan src/ folder for manually created C/C++ files that splat doesn't know about
-    if Path("src").exists():
-        for src_file in Path("src").rglob("*.cpp"):
-            # Build this C++ file
-            build([src_file], [src_file], "cc", collect_objdiff=True, orig_entry=None)
-        
-        for src_file in Path("src").rglob("*.c"):
-            # Build this C file
+    # Patch the asm of functions hit by the short loop bug
+    for paths in short_loop.values():
+        for path in paths:
+            pristine = SHORT_LOOP_DIR / path
+            ninja.build(
+                path.as_posix(),
+                "shortloop",
+                pristine.as_posix(),
+                implicit_outputs=[pristine.as_posix() + ".sha1"],
+                variables={"hash": pristine.as_posix() + ".sha1"},
+            )
+
+    # Build all the objects
+    for entry in model:
+        build_segment(entry, entry.task)
+
+    # Build C/C++ files in src/ that splat doesn't know about, skipping those it already emitted
+    for suffix in SRC_SUFFIXES:
+        for src_file in src_files:
+            if src_file.suffix != suffix or src_file in built_sources:
+                continue
+            if only and not unit_selected(unit_rel_path(src_file).with_suffix("").as_posix(), only):
+                continue
             build([src_file], [src_file], "cc", collect_objdiff=True, orig_entry=None)
 
+    if only:
+        print(f"Partial build: {len(built_objects) - len(reference_keys)} units selected, {len(reference_keys)} linked from {REFERENCE_DIR}")
+        REFERENCE_DIR.mkdir(parents=True, exist_ok=True)
+        write_if_changed(REFERENCE_MANIFEST_PATH, json.dumps(reference_keys, indent=2, sort_keys=True))
+        write_if_changed(REFERENCE_LD_PATH, reference_linker_script(reference_objects))
+
     if objects_only:
-        # Write objdiff.json if dual_objects (i.e. --objects)
-        if dual_objects:
-            objdiff = {
-                "$schema": "https://raw.githubusercontent.com/encounter/objdiff/main/config.schema.json",
-                "custom_make": "ninja",
-                "custom_args": [],
-                "build_target": False,
-                "build_base": True,
-                "watch_patterns": [
-                    "src/**/*.c",
-                    "src/**/*.cp",
-                    "src/**/*.cpp",
-                    "src/**/*.cxx",
-                    "src/**/*.h",
-                    "src/**/*.hp",
-                    "src/**/*.hpp",
-                    "src/**/*.hxx",
-                    "src/**/*.s",
-                    "src/**/*.S",
-                    "src/**/*.asm",
-                    "src/**/*.inc",
-                    "src/**/*.py",
-                    "src/**/*.yml",
-                    "src/**/*.txt",
-                    "src/**/*.json"
-                ],
-                "units": objdiff_units,
-                "progress_categories": [ {"id": id, "name": name} for id, name in CATEGORY_MAP.items() ],
-            }
-            with open("objdiff.json", "w", encoding="utf-8") as f:
-                json.dump(objdiff, f, indent=2)
-        return
+        # Write objdiff.json if dual_objects (i.e. --objects); a partial build keeps the full one
+        written_units = None
+        if dual_objects and not only:
+            PROFILER.start("objdiff.json")
+            write_objdiff(objdiff_units)
+            written_units = objdiff_units
+        PROFILER.start("write build.ninja")
+        write_if_changed(NINJA_PATH, ninja_out.getvalue())
+        return written_units
 
     # Write objdiff.json for regular build mode
-    if objdiff_units:
-        objdiff = {
-            "$schema": "https://raw.githubusercontent.com/encounter/objdiff/main/config.schema.json",
-            "custom_make": "ninja",
-            "custom_args": [],
-            "build_target": False,
-            "build_base": True,
-            "watch_patterns": [
-                "src/**/*.c",
-                "src/**/*.cp",
-                "src/**/*.cpp",
-                "src/**/*.cxx",
-                "src/**/*.h",
-                "src/**/*.hp",
-                "src/**/*.hpp",
-                "src/**/*.hxx",
-                "src/**/*.s",
-                "src/**/*.S",
-                "src/**/*.asm",
-                "src/**/*.inc",
-                "src/**/*.py",
-                "src/**/*.yml",
-                "src/**/*.txt",
-                "src/**/*.json"
-            ],
-            "units": objdiff_units,
-            "progress_categories": [ {"id": id, "name": name} for id, name in CATEGORY_MAP.items() ],
-        }
-        with open("objdiff.json", "w", encoding="utf-8") as f:
-            json.dump(objdiff, f, indent=2)
+    written_units = None
+    if objdiff_units and not only:
+        PROFILER.start("objdiff.json")
+        write_objdiff(objdiff_units)
+        written_units = objdiff_units
+    PROFILER.start("link edges")
 
-    ninja.build(
-        PRE_ELF_PATH,
-        "ld",
-        LD_PATH,
-        implicit=[str(obj) for obj in built_objects],
-        variables={"mapfile": MAP_PATH},
-    )
+    if patch_link:
+        # The map and ELF are only relinked when a full link was needed, a patch link just touches them
+        ninja.build(
+            linked_path,
+            "patchlink",
+            link_script,
+            implicit=[str(obj) for obj in built_objects],
+            implicit_outputs=[PRE_ELF_PATH, MAP_PATH],
+            variables={"mapfile": MAP_PATH},
+        )
+    else:
+        ninja.build(
+            PRE_ELF_PATH,
+            "ld",
+            link_script,
+            implicit=[str(obj) for obj in built_objects],
+            implicit_outputs=[MAP_PATH],
+            variables={"mapfile": MAP_PATH},
+        )
+
+        ninja.build(
+            linked_path,
+            "elf",
+            PRE_ELF_PATH,
+        )
+
+    if splice_range:
+        ninja.build(
+            ELF_PATH,
+            "splice",
+            linked_path,
+            implicit=[TARGET_PATH],
+            variables={"start": f"0x{splice_range[0]:X}", "end": f"0x{splice_range[1]:X}"},
+        )
 
+    # Always produced, so a checksum failure comes with a report of where the image differs
     ninja.build(
+        VERIFY_PATH,
+        "verify",
         ELF_PATH,
-        "elf",
-        PRE_ELF_PATH,
+        implicit=[TARGET_PATH, MAP_PATH, str(YAML_FILE)],
     )
 
     if not skip_checksum:
@@ -451,12 +1031,12 @@ def build_stuff(linker_entries: List[LinkerEntry], skip_checksum=False, objects_
     else:
         print("Skipping checksum step")
 
-#MARK: Short loop fix
-# Pattern to workaround unintended nops around loops
-COMMENT_PART = r"\/\* (.+) ([0-9A-Z]{2})([0-9A-Z]{2})([0-9A-Z]{2})([0-9A-Z]{2}) \*\/"
-INSTRUCTION_PART = r"(\b(bne|bnel|beq|beql|bnez|bnezl|beqzl|bgez|bgezl|bgtz|bgtzl|blez|blezl|bltz|bltzl|b)\b.*)"
-OPCODE_PATTERN = re.compile(f"{COMMENT_PART}  {INSTRUCTION_PART}")
+    PROFILER.start("write build.ninja")
+    write_if_changed(NINJA_PATH, ninja_out.getvalue())
+    return written_units
 
+#MARK: Short loop fix
+# Known functions whose loops trigger the short loop bug, on top of the ones tools/loopscan.py finds
 PROBLEMATIC_FUNCS = set(
     [
         "UpdateJtActive__FP2JTP3JOYf", # P2/jt
@@ -478,33 +1058,275 @@ PROBLEMATIC_FUNCS = set(
     ]
 )
 
-def replace_instructions_with_opcodes(asm_folder: Path) -> None:
+def short_loop_funcs(c_segments) -> Dict[str, int]:
     """
-    Replace branch instructions with raw opcodes for functions that trigger the short loop bug.
+    Find the functions of the C segments with short loops, scanning their original bytes against
+    splat's function symbols. Returns their original sizes.
     """
-    nm_folder = ROOT / asm_folder / "nonmatchings"
+    import loopscan
 
-    for p in nm_folder.rglob("*.s"):
-        if p.stem not in PROBLEMATIC_FUNCS:
+    functions = sorted(
+        (sym.vram_start, sym.name, sym.size) for sym in splat_symbols.all_symbols if sym.type == "func" and sym.size
+    )
+    addresses = [vram for vram, _, _ in functions]
+    affected: Dict[str, int] = {}
+    with open(splat_options.opts.target_path, "rb") as f:
+        for seg in c_segments:
+            f.seek(seg.rom_start)
+            data = f.read(seg.rom_end - seg.rom_start)
+            lo = bisect.bisect_left(addresses, seg.vram_start)
+            hi = bisect.bisect_left(addresses, seg.vram_end)
+            in_segment = [(name, vram, size) for vram, name, size in functions[lo:hi]]
+            sizes = {name: size for name, _, size in in_segment}
+            for name in loopscan.affected_functions(data, seg.vram_start, in_segment):
+                affected[name] = sizes[name]
+    return affected
+
+
+def short_loop_candidates(linker_entries: List["LinkerEntry"]) -> Dict[str, Dict]:
+    """
+    Resolve PROBLEMATIC_FUNCS and the functions with short loops to their split asm files through
+    splat's symbol table. Returns, by the unique id of the C segment that includes them, its
+    compiled object and {function: [original size, asm file]}; the size is None for
+    PROBLEMATIC_FUNCS, which are patched regardless.
+    """
+    c_segments = {}
+    c_objects = {}
+    for entry in linker_entries:
+        if isinstance(entry.segment, splat.segtypes.common.c.CommonSegC):
+            seg_id = entry.segment.unique_id()
+            c_segments[seg_id] = entry.segment
+            c_objects[seg_id] = linked_object_path(Path(entry.object_path), Path(entry.src_paths[0])).as_posix()
+
+    scanned = short_loop_funcs(c_segments.values())
+
+    # Segments don't overlap, so the one holding a symbol is the last starting at or before it
+    by_vram = sorted((seg.vram_start, seg_id) for seg_id, seg in c_segments.items())
+    starts = [vram for vram, _ in by_vram]
+
+    candidates: Dict[str, Dict] = {}
+    nonmatchings = splat_options.opts.nonmatchings_path
+    for sym in splat_symbols.all_symbols:
+        if sym.name not in PROBLEMATIC_FUNCS and sym.name not in scanned:
             continue
+        idx = bisect.bisect_right(starts, sym.vram_start) - 1
+        if idx < 0:
+            continue
+        seg_id = by_vram[idx][1]
+        seg = c_segments[seg_id]
+        if sym.vram_start < seg.vram_end:
+            path = Path(os.path.relpath(nonmatchings / seg.dir / seg.name / f"{sym.name}.s", ROOT))
+            size = None if sym.name in PROBLEMATIC_FUNCS else scanned[sym.name]
+            unit = candidates.setdefault(seg_id, {"object": c_objects[seg_id], "functions": {}})
+            unit["functions"][sym.name] = [size, path.as_posix()]
+    return candidates
 
-        with p.open("r") as file:
-            content = file.read()
 
-        if re.search(OPCODE_PATTERN, content):
-            # Reference found
-            # Embed the opcode, we have to swap byte order for correct endianness
-            content = re.sub(
-                OPCODE_PATTERN,
-                r"/* \1 \2\3\4\5 */  .word      0x\5\4\3\2 /* \6 */",
-                content,
-            )
+def select_short_loop_sources(candidates: Dict[str, Dict]) -> Dict[str, List[Path]]:
+    """
+    Pick the candidates to patch: PROBLEMATIC_FUNCS and the functions their compiled object shows
+    were padded. Once patched, the object no longer shows it, so confirmed functions are kept in
+    build/shortloop/state.json, along with the objects already checked. Candidates patched before
+    but no longer picked get their split asm back.
+    """
+    try:
+        with SHORT_LOOP_STATE_PATH.open("r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {"confirmed": [], "checked": {}}
+    confirmed = set(state["confirmed"])
+    checked = {}
+
+    selected: Dict[str, List[Path]] = {}
+    for seg_id, unit in candidates.items():
+        obj = unit["object"]
+        unknown = {name: size for name, (size, _) in unit["functions"].items() if size is not None and name not in confirmed}
+        if unknown:
+            fingerprint = file_fingerprint([obj])[obj]
+            checked[obj] = fingerprint
+            if fingerprint is not None and state["checked"].get(obj) != fingerprint:
+                import loopscan
+
+                for name in sorted(loopscan.confirmed_functions(unknown, Path(obj))):
+                    print(f"Short loop bug confirmed in {name} by {obj}, consider adding it to PROBLEMATIC_FUNCS")
+                    confirmed.add(name)
+
+        for name, (size, path) in unit["functions"].items():
+            if size is None or name in confirmed:
+                selected.setdefault(seg_id, []).append(Path(path))
+            else:
+                restore_short_loop_source(Path(path))
+
+    SHORT_LOOP_DIR.mkdir(parents=True, exist_ok=True)
+    write_if_changed(SHORT_LOOP_STATE_PATH, json.dumps({"confirmed": sorted(confirmed), "checked": checked}, indent=2, sort_keys=True))
+    return selected
 
-            # Write the updated content back to the file
-            with p.open("w") as file:
-                file.write(content)
+
+def restore_short_loop_source(path: Path):
+    """
+    Put the pristine split asm of a function that's no longer patched back in place.
+    """
+    pristine = SHORT_LOOP_DIR / path
+    if not pristine.exists():
+        return
+    write_if_changed(path, pristine.read_text(encoding="utf-8"))
+    pristine.unlink()
+    pristine.with_name(pristine.name + ".sha1").unlink(missing_ok=True)
+
+
+def stage_short_loop_sources(sources: Dict[str, List[Path]]) -> Dict[str, List[Path]]:
+    """
+    Move freshly split asm for the affected functions to build/shortloop, where the shortloop
+    edges read it from. A file is fresh when its sha1 differs from the one the last patch
+    recorded. Returns the sources that have a pristine copy to patch from.
+    """
+    staged: Dict[str, List[Path]] = {}
+    for seg_id, paths in sources.items():
+        for path in paths:
+            pristine = SHORT_LOOP_DIR / path
+            try:
+                content = path.read_text(encoding="utf-8")
+                recorded = pristine.with_name(pristine.name + ".sha1").read_text(encoding="utf-8").strip()
+            except OSError:
+                recorded = None
+            if path.exists() and hashlib.sha1(content.encode("utf-8")).hexdigest() != recorded:
+                pristine.parent.mkdir(parents=True, exist_ok=True)
+                write_if_changed(pristine, content)
+                # Removed so ninja rewrites it even when the split kept the old mtime
+                path.unlink()
+            if pristine.exists():
+                staged.setdefault(seg_id, []).append(path)
+    return staged
+
+#MARK: Snapshot
+def file_fingerprint(paths) -> Dict[str, Optional[List[int]]]:
+    """
+    Return the size and mtime of each path, None for missing ones.
+    """
+    fingerprint: Dict[str, Optional[List[int]]] = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            fingerprint[str(path)] = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            fingerprint[str(path)] = None
+    return fingerprint
+
+
+def snapshot_inputs(splice: bool) -> Dict:
+    """
+    Fingerprint what the split and the build model derive from: this script and the short loop
+    scanner, the yaml, symbol_addrs.txt, the original binary, the installed splat and the
+    disassemblers under it, and --splice.
+    """
+    paths = [ROOT / "configure.py", TOOLS_DIR / "loopscan.py", TOOLS_DIR / "shortloop.py", TOOLS_DIR / "elffile.py", YAML_FILE, SYMBOL_ADDRS_PATH, TARGET_PATH]
+    # Locating the packages doesn't import them. Every file of a package is fingerprinted, since an
+    # upgrade or an edit to an editable install can leave __init__.py as it was.
+    for name in SPLIT_PACKAGES:
+        spec = importlib.util.find_spec(name)
+        if spec is None or spec.origin is None:
+            continue
+        if spec.submodule_search_locations:
+            for location in spec.submodule_search_locations:
+                paths += sorted(p for p in Path(location).rglob("*") if p.suffix in (".py", ".so", ".pyd"))
+        else:
+            paths.append(Path(spec.origin))
+    return {"files": file_fingerprint(paths), "splice": splice}
+
+
+def snapshot_graph(configure_args: List[str], src_dirs: List[Path], short_loop: Optional[Dict[str, List[Path]]]) -> Dict:
+    """
+    Fingerprint what build.ninja derives from on top of the build model: the arguments, the
+    interpreter, the binutils in use, the directories under src/, whose mtimes change when
+    files are added or removed, and the short loop functions picked for patching.
+    """
+    binutils = [TOOLS_DIR / "binutils" / "mips-linux-gnu-as", TOOLS_DIR / "binutils" / "mips-linux-gnu-as.exe"]
+    dirs = {}
+    for path in src_dirs:
+        try:
+            dirs[path.as_posix()] = os.stat(path).st_mtime_ns
+        except OSError:
+            dirs[path.as_posix()] = None
+    if short_loop is not None:
+        short_loop = {seg_id: [p.as_posix() for p in paths] for seg_id, paths in short_loop.items()}
+    return {"args": configure_args, "python": sys.executable, "binutils": file_fingerprint(binutils), "dirs": dirs, "short_loop": short_loop}
+
+
+def load_snapshot(inputs: Dict, short_loop: bool) -> Optional[Dict]:
+    """
+    Load the snapshot of the last configure, if it was taken from the same inputs and the split
+    files it lists are still there.
+    """
+    try:
+        with SNAPSHOT_PATH.open("r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if snapshot.get("version") != SNAPSHOT_VERSION or snapshot["inputs"] != inputs:
+        return None
+    if short_loop and snapshot["short_loop"] is None:
+        return None
+    if not os.path.exists(LD_PATH):
+        return None
+    for _, _, _, _, src_paths, _ in snapshot["entries"]:
+        for src in src_paths:
+            if not os.path.exists(src):
+                return None
+    return snapshot
+
+
+def snapshot_model(snapshot: Dict) -> List[BuildEntry]:
+    return [
+        BuildEntry(segment_id, segment_type, task, Path(object_path), [Path(s) for s in src_paths], key)
+        for segment_id, segment_type, task, object_path, src_paths, key in snapshot["entries"]
+    ]
+
+
+def write_snapshot(inputs: Dict, graph: Dict, model: List[BuildEntry], short_loop: Optional[Dict[str, Dict]], splice_range: Optional[List[int]], objdiff_units: Optional[List[Dict]]):
+    """
+    Write the snapshot the next configure starts from: the input fingerprints, the build model,
+    the short loop candidates, the splice range and the units written to objdiff.json.
+    """
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "inputs": inputs,
+        "graph": graph,
+        "entries": [
+            [e.segment_id, e.segment_type, e.task, e.object_path.as_posix(), [s.as_posix() for s in e.src_paths], e.key]
+            for e in model
+        ],
+        "short_loop": short_loop,
+        "splice_range": splice_range,
+        "objdiff_units": objdiff_units,
+    }
+    write_if_changed(SNAPSHOT_PATH, json.dumps(snapshot, separators=(",", ":")))
 
 #MARK: Main
+def regeneration_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> List[str]:
+    """
+    Rebuild the arguments ninja reruns configure.py with from the parsed ones, in their long form.
+    The clean options are left out, as cleaning on every regeneration would rebuild everything,
+    and so are the ones that return before build.ninja is written.
+    """
+    skipped = {"help", "clean", "clean_only", "symbols_only", "symbols_check"}
+    configure_args: List[str] = []
+    for action in parser._actions:
+        if action.dest in skipped:
+            continue
+        option = max(action.option_strings, key=len)
+        value = getattr(args, action.dest)
+        if isinstance(action, argparse._StoreTrueAction):
+            if value:
+                configure_args.append(option)
+        elif isinstance(action, argparse._AppendAction):
+            for item in value or []:
+                configure_args += [option, item]
+        elif value != action.default:
+            configure_args += [option, str(value)]
+    return configure_args
+
+
 def main():
     """
     Main function, parses arguments and runs the configuration.
@@ -533,36 +1355,158 @@ def main():
         help="Build objects to obj/target and obj/current (with -DSKIP_ASM), skip linking and checksum",
         action="store_true",
     )
+    parser.add_argument(
+        "--with-objects",
+        help="Also build objects to obj/target and obj/current for objdiff, in the same graph as the linked ELF",
+        action="store_true",
+    )
     parser.add_argument(
         "-noloop",
         "--no-short-loop-workaround",
         help="Do not replace branch instructions with raw opcodes for functions that trigger the short loop bug",
         action="store_true",
     )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        help="Only re-split segments whose yaml entry, byte range, symbols or splat version changed",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compile-server",
+        help="Compile through the mwccps2 compile server (start it with tools/mwcc_server.py serve), which keeps one wineserver and Wine prefix alive across compiles; each compile still starts its own mwccps2 process",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--object-cache",
+        help="Run the cc and as rules through the object cache in tools/objcache.py",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--patch-link",
+        help="Patch changed objects into the last linked image, falling back to a full link when layouts shift",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--symbols",
+        help="Refresh symbol_addrs.txt from the original binary's symtab before splitting, reporting drift",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--symbols-only",
+        help="Only refresh symbol_addrs.txt from the original binary's symtab",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--symbols-check",
+        help="Only report drift between symbol_addrs.txt and the original binary's symtab",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--splice",
+        help="Leave the non-loadable sections after the image out of the split and link, and copy them from the original binary",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--only",
+        help="Only build units matching this glob, path prefix, directory or category (repeatable); the rest link against cached reference objects",
+        action="append",
+        metavar="PATTERN",
+    )
+    parser.add_argument(
+        "--profile",
+        help=f"Record the time and peak memory of each configure phase to {PROFILE_PATH}, for tools/buildprof.py",
+        action="store_true",
+    )
     args = parser.parse_args()
 
     do_clean = (args.clean or args.clean_only) or False
     do_skip_checksum = args.skip_checksum or False
     do_objects = args.objects or False
+    do_compile_server = args.compile_server or False
+    do_object_cache = args.object_cache or False
+
+    if do_compile_server and COMPILE_CMD == GAME_MWCC_CMD:
+        print("The compile server is only used under Wine, compiling directly")
+        do_compile_server = False
 
     if do_clean:
+        PROFILER.start("clean")
         clean()
         if args.clean_only:
             return
 
-    split.main([YAML_FILE], modes="all", verbose=False)
+    if args.symbols or args.symbols_only or args.symbols_check:
+        PROFILER.start("symbols")
+        refresh_symbols(check=args.symbols_check)
+        if args.symbols_only or args.symbols_check:
+            return
+
+    configure_args = regeneration_args(parser, args)
+
+    PROFILER.start("fingerprints")
+    inputs = snapshot_inputs(args.splice)
+    snapshot = load_snapshot(inputs, not args.no_short_loop_workaround)
+
+    if snapshot is None:
+        PROFILER.start("split")
+        import_splat()
+        splice_range = splice_segments() if args.splice else None
+
+        if args.incremental:
+            split_incremental()
+        else:
+            split.main([YAML_FILE], modes="all", verbose=False)
+
+        linker_entries = split.linker_writer.entries
+        model = build_model(linker_entries, split_common_key())
+        candidates = None
+        if not args.no_short_loop_workaround:
+            PROFILER.start("short loop scan")
+            candidates = short_loop_candidates(linker_entries)
+    else:
+        candidates = snapshot["short_loop"]
+
+    # Compiled objects confirm short loop candidates, so the pick can change without the split
+    selected = None
+    if not args.no_short_loop_workaround:
+        PROFILER.start("short loop")
+        selected = select_short_loop_sources(candidates)
+
+    if snapshot is not None:
+        # With nothing changed, build.ninja is current. --only is left out, as C source edits change
+        # its reference keys, and so is --profile, which records the units as the graph is built.
+        graph = snapshot_graph(configure_args, [Path(d) for d in snapshot["graph"]["dirs"]], selected)
+        if not args.only and not args.profile and os.path.exists(NINJA_PATH) and snapshot["graph"] == graph:
+            if snapshot["objdiff_units"] is not None and not os.path.exists(OBJDIFF_PATH):
+                write_objdiff(snapshot["objdiff_units"])
+            write_permuter_settings()
+            print("Nothing changed since the last configure")
+            return
+
+        print("Split inputs unchanged, regenerating build.ninja from the snapshot")
+        model = snapshot_model(snapshot)
+        splice_range = snapshot["splice_range"]
 
-    linker_entries = split.linker_writer.entries
+    short_loop = None
+    if selected is not None:
+        short_loop = stage_short_loop_sources(selected)
 
     if do_objects:
-        build_stuff(linker_entries, skip_checksum=True, objects_only=True, dual_objects=True)
+        objdiff_units = build_stuff(model, skip_checksum=True, objects_only=True, dual_objects=True, compile_server=do_compile_server, object_cache=do_object_cache, patch_link=args.patch_link, splice_range=splice_range, configure_args=configure_args, only=args.only, short_loop=short_loop)
     else:
-        build_stuff(linker_entries, do_skip_checksum)
+        objdiff_units = build_stuff(model, do_skip_checksum, dual_objects=args.with_objects, compile_server=do_compile_server, object_cache=do_object_cache, patch_link=args.patch_link, splice_range=splice_range, configure_args=configure_args, only=args.only, short_loop=short_loop)
 
+    PROFILER.start("permuter settings")
     write_permuter_settings()
 
-    if not args.no_short_loop_workaround:
-        replace_instructions_with_opcodes(split.config["options"]["asm_path"])
+    PROFILER.start("snapshot")
+    src_dirs = index_sources(SRC_DIR)[3]
+    write_snapshot(inputs, snapshot_graph(configure_args, src_dirs, selected), model, candidates, splice_range, objdiff_units)
+
+    if args.profile:
+        PROFILER.write(PROFILE_PATH)
+        print(f"Wrote {PROFILE_PATH}; after building, run tools/buildprof.py for the per-unit report")
 
 if __name__ == "__main__":
     main()
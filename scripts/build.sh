@@ -13,5 +13,5 @@ if [ ! -f disc/SLUS_216.42 ]; then
 fi
 
 # Configure and build
-python3 configure.py --clean
+python3 configure.py --incremental
 ninja
\ No newline at end of file
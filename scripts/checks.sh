@@ -5,6 +5,7 @@ set -e
 script_dir=$(dirname $0)
 pushd $script_dir/.. > /dev/null
 
-python3 configure.py --clean && ninja
-python3 configure.py --clean --objects && ninja
-./tools/objdiff/objdiff-cli report generate > /dev/null
+python3 configure.py --incremental --with-objects && ninja
+python3 tools/progress.py
+# A quick run on small synthetic projects, so configure.py changes that break the benchmark show up
+python3 tools/configbench.py --sizes 100 500 --repeat 1
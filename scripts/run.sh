@@ -56,7 +56,7 @@ pushd "$(dirname "$0")/.." > /dev/null
 
 # Build the game
 echo Compiling ELF...
-#python3 configure.py --clean
+#python3 configure.py --incremental
 ninja
 
 # Run the game
@@ -0,0 +1,193 @@
+"""
+Build profile report. Combines the configure phases recorded by `configure.py --profile` with
+the edges of the last ninja run from .ninja_log, and writes a JSON summary (time per rule, per
+objdiff category and the slowest translation units) plus a Chrome trace that opens in
+chrome://tracing or Perfetto. Rules come from build.ninja, units and categories from the
+configure profile.
+"""
+#! /usr/bin/env python3
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+#MARK: Constants
+DEFAULT_TOP = 20
+
+#MARK: Ninja log
+class LogEntry(NamedTuple):
+    start_ms: int
+    end_ms: int
+    output: str
+    cmdhash: str
+
+
+def read_last_run(log_path: Path) -> List[LogEntry]:
+    """
+    Return the edges of the last ninja run, one entry per edge.
+    Entries are appended as edges finish, so a run ends where the end times go backwards.
+    """
+    runs: List[List[LogEntry]] = [[]]
+    last_end = -1
+    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 5:
+                continue
+            entry = LogEntry(int(fields[0]), int(fields[1]), fields[3], fields[4])
+            if entry.end_ms < last_end:
+                runs.append([])
+            last_end = entry.end_ms
+            runs[-1].append(entry)
+
+    # Edges with several outputs log one line per output
+    seen = set()
+    edges = []
+    for entry in runs[-1]:
+        key = (entry.start_ms, entry.end_ms, entry.cmdhash)
+        if key in seen:
+            continue
+        seen.add(key)
+        edges.append(entry)
+    return edges
+
+def read_rules(ninja_path: Path) -> Dict[str, str]:
+    """
+    Map every output in build.ninja, implicit ones included, to the rule that builds it.
+    """
+    rules = {}
+    with open(ninja_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.startswith("build "):
+                continue
+            outputs, _, rest = line[len("build "):].partition(": ")
+            rule = rest.split(" ", 1)[0].strip()
+            for output in outputs.replace("| ", "").split():
+                rules[output.replace("$:", ":").replace("$ ", " ")] = rule
+    return rules
+
+#MARK: Report
+def assign_lanes(edges: List[LogEntry]) -> List[int]:
+    """
+    Spread overlapping edges over trace rows, like ninja's parallel jobs.
+    """
+    lanes_end: List[int] = []
+    lanes = []
+    for edge in edges:
+        for lane, end in enumerate(lanes_end):
+            if end <= edge.start_ms:
+                lanes_end[lane] = edge.end_ms
+                lanes.append(lane)
+                break
+        else:
+            lanes_end.append(edge.end_ms)
+            lanes.append(len(lanes_end) - 1)
+    return lanes
+
+
+def report(phases_path: Optional[Path], log_path: Optional[Path], ninja_path: Optional[Path], out_dir: Path, top: int = DEFAULT_TOP) -> Dict:
+    """
+    Build the summary, write it and the trace to out_dir and return it.
+    """
+    configure = {"phases": [], "units": {}, "categories": {}}
+    if phases_path is not None and phases_path.exists():
+        with open(phases_path, "r", encoding="utf-8") as f:
+            configure = json.load(f)
+
+    rules = {}
+    if ninja_path is not None and ninja_path.exists():
+        rules = read_rules(ninja_path)
+
+    edges = []
+    if log_path is not None and log_path.exists():
+        edges = sorted(read_last_run(log_path), key=lambda e: e.start_ms)
+
+    by_rule: Dict[str, int] = {}
+    by_category: Dict[str, int] = {}
+    units = []
+    for edge in edges:
+        info = configure["units"].get(edge.output, {})
+        duration = edge.end_ms - edge.start_ms
+        rule = rules.get(edge.output, "other")
+        by_rule[rule] = by_rule.get(rule, 0) + duration
+        for category in info.get("categories", []):
+            name = configure["categories"].get(category, category)
+            by_category[name] = by_category.get(name, 0) + duration
+        if "unit" in info:
+            units.append({"unit": info["unit"], "rule": rule, "output": edge.output, "ms": duration})
+
+    units.sort(key=lambda u: u["ms"], reverse=True)
+    summary = {
+        "configure": configure["phases"],
+        "configure_ms": sum(p["wall_ms"] for p in configure["phases"]),
+        "ninja_ms": max((e.end_ms for e in edges), default=0),
+        "ninja_edges": len(edges),
+        "by_rule": dict(sorted(by_rule.items(), key=lambda kv: kv[1], reverse=True)),
+        "by_category": dict(sorted(by_category.items(), key=lambda kv: kv[1], reverse=True)),
+        "top_units": units[:top],
+    }
+
+    # Configure phases on one row, then the ninja edges after them, one row per parallel job
+    events = []
+    for phase in configure["phases"]:
+        events.append({
+            "name": phase["name"], "ph": "X", "pid": 1, "tid": 0,
+            "ts": round(phase["start_ms"] * 1000), "dur": round(phase["wall_ms"] * 1000),
+            "args": {"cpu_ms": phase["cpu_ms"], "peak_rss_kib": phase["peak_rss_kib"]},
+        })
+    offset_us = round(summary["configure_ms"] * 1000)
+    for edge, lane in zip(edges, assign_lanes(edges)):
+        info = configure["units"].get(edge.output, {})
+        events.append({
+            "name": info.get("unit", edge.output), "cat": rules.get(edge.output, "other"), "ph": "X", "pid": 2, "tid": lane,
+            "ts": offset_us + edge.start_ms * 1000, "dur": (edge.end_ms - edge.start_ms) * 1000,
+        })
+    events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "configure"}})
+    events.append({"name": "process_name", "ph": "M", "pid": 2, "args": {"name": "ninja"}})
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    with open(out_dir / "trace.json", "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return summary
+
+
+def print_summary(summary: Dict) -> None:
+    """
+    Print the configure phases, the time per rule and category, and the slowest units.
+    """
+    print(f"configure: {summary['configure_ms']:.0f} ms")
+    for phase in summary["configure"]:
+        print(f"  {phase['name']:<24} {phase['wall_ms']:>9.0f} ms wall {phase['cpu_ms']:>9.0f} ms cpu {phase['peak_rss_kib'] or 0:>9} KiB peak")
+    print(f"ninja: {summary['ninja_ms']} ms, {summary['ninja_edges']} edges")
+    for rule, ms in summary["by_rule"].items():
+        print(f"  {rule:<24} {ms:>9} ms")
+    if summary["by_category"]:
+        print("by category:")
+        for category, ms in summary["by_category"].items():
+            print(f"  {category:<24} {ms:>9} ms")
+    if summary["top_units"]:
+        print(f"slowest {len(summary['top_units'])} units:")
+        for unit in summary["top_units"]:
+            print(f"  {unit['ms']:>7} ms  {unit['rule']:<6} {unit['unit']}")
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments and writes the report.
+    """
+    parser = argparse.ArgumentParser(description="Report where configure and the last ninja build spent their time")
+    parser.add_argument("--phases", help="Configure phases recorded by configure.py --profile", type=Path, default=Path("build/profile/configure.json"))
+    parser.add_argument("--log", help="ninja log", type=Path, default=Path(".ninja_log"))
+    parser.add_argument("--ninja", help="ninja file the log was built from", type=Path, default=Path("build.ninja"))
+    parser.add_argument("-o", "--out-dir", help="Directory to write summary.json and trace.json to", type=Path, default=Path("build/profile"))
+    parser.add_argument("-n", "--top", help="Number of slowest units to list", type=int, default=DEFAULT_TOP)
+    args = parser.parse_args()
+
+    print_summary(report(args.phases, args.log, args.ninja, args.out_dir, args.top))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Benchmark for configure.py's graph generation, without the game binary. For each size it lays out
+a synthetic project (src/ tree, C function bytes, split asm for the functions with short loops) in
+a scratch directory, stands in for splat's linker entries, symbols and options with stubs, and
+times the build model, build_stuff (plain and with --with-objects) and the short loop scan,
+selection and stage.
+
+Each phase's time per unit at the largest size is compared against the smallest; the benchmark
+fails when it grew more than --max-ratio, i.e. when scaling stops being roughly linear. Results
+are appended to a JSON history and compared against the previous run.
+"""
+#! /usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).parent.parent.resolve()
+sys.path.insert(0, str(ROOT))
+
+import configure
+from splat.segtypes.common.asmtu import CommonSegAsmtu
+from splat.segtypes.common.c import CommonSegC
+from splat.segtypes.common.data import CommonSegData
+
+#MARK: Constants
+DEFAULT_SIZES = [1000, 10000, 50000]
+DEFAULT_HISTORY = ROOT / "build" / "bench" / "configure.json"
+DEFAULT_MAX_RATIO = 2.0
+
+FUNCS_PER_C_UNIT = 4
+FUNC_WORDS = 16
+SHORT_LOOP_EVERY = 10  # One function in this many gets a short loop
+VRAM_BASE = 0x100000
+SHORT_LOOP_BRANCH = (0x05 << 26) | 0xFFFE  # bne $zero, $zero, -2
+
+#MARK: Stubs
+class StubSegment:
+    """
+    Just the segment state configure.py reads, in front of the real splat class so isinstance works.
+    """
+    dir = None
+    vram_end = None
+    yaml = None
+
+    def __init__(self, seg_type: str, name: str, rom_start: int, rom_end: int, vram_start: int):
+        self.type = seg_type
+        self.name = name
+        self.dir = Path()
+        self.rom_start = rom_start
+        self.rom_end = rom_end
+        self.vram_start = vram_start
+        self.vram_end = vram_start + rom_end - rom_start
+
+    def unique_id(self) -> str:
+        return f"{self.type}_{self.name}"
+
+
+class StubAsm(StubSegment, CommonSegAsmtu):
+    pass
+
+
+class StubC(StubSegment, CommonSegC):
+    pass
+
+
+class StubData(StubSegment, CommonSegData):
+    pass
+
+#MARK: Project
+def unit_name(i: int) -> str:
+    """
+    Spread units over directories and categories roughly like config/sonic.yaml.
+    """
+    if i % 20 == 0:
+        return f"sce/lib{i // 500}/unit{i}"
+    if i % 10 == 5:
+        return f"data/unit{i}"
+    if i % 50 == 1:
+        return f"P2/splice/unit{i}"
+    return f"P2/dir{i // 100}/unit{i}"
+
+
+def make_project(units: int):
+    """
+    Lay out a synthetic project of the given number of units in the current directory, and return its
+    linker entries, splat symbols and the split asm files to restore before each short loop run.
+    """
+    entries = []
+    symbols = []
+    asm_files: Dict[Path, str] = {}
+    code = bytearray()
+
+    for i in range(units):
+        name = unit_name(i)
+        if name.startswith("data/"):
+            seg = StubData("data", name, 0, 0, 0)
+            entries.append(SimpleNamespace(segment=seg, object_path=Path(f"build/asm/{name}.s.o"), src_paths=[Path(f"asm/{name}.s")]))
+        elif i % 5 == 2:
+            # A C unit, with its function bytes in the image
+            start = len(code)
+            vram = VRAM_BASE + start
+            for f in range(FUNCS_PER_C_UNIT):
+                words = [0] * FUNC_WORDS
+                func = f"func_{vram + f * FUNC_WORDS * 4:08X}"
+                if (i * FUNCS_PER_C_UNIT + f) % SHORT_LOOP_EVERY == 0:
+                    words[FUNC_WORDS // 2] = SHORT_LOOP_BRANCH
+                    asm_files[Path("asm/nonmatchings") / name / f"{func}.s"] = f"glabel {func}\n/* 0 0 00000000 */  nop\n"
+                code += b"".join(w.to_bytes(4, "little") for w in words)
+                symbols.append(SimpleNamespace(type="func", name=func, vram_start=vram + f * FUNC_WORDS * 4, size=FUNC_WORDS * 4))
+            seg = StubC("c", name, start, len(code), vram)
+            src = Path(f"src/{name}.cpp")
+            src.parent.mkdir(parents=True, exist_ok=True)
+            src.write_text(f'#include "common.h"\n\nINCLUDE_ASM("asm/nonmatchings/{name}", func);\n', encoding="utf-8")
+            entries.append(SimpleNamespace(segment=seg, object_path=Path(f"build/src/{name}.cpp.o"), src_paths=[src]))
+        else:
+            seg = StubAsm("asmtu", name, 0, 0, 0)
+            entries.append(SimpleNamespace(segment=seg, object_path=Path(f"build/asm/{name}.s.o"), src_paths=[Path(f"asm/{name}.s")]))
+
+        if i % 20 == 3:
+            # Sources splat doesn't know about yet
+            extra = Path(f"src/{name}_extra.cpp")
+            extra.parent.mkdir(parents=True, exist_ok=True)
+            extra.write_text("", encoding="utf-8")
+
+    Path("disc").mkdir(exist_ok=True)
+    Path(configure.TARGET_PATH).write_bytes(bytes(code))
+    return entries, symbols, asm_files
+
+
+def confirm_short_loops(candidates: Dict[str, Dict]):
+    """
+    Record every short loop candidate as confirmed, as a build whose objects showed the padding would.
+    """
+    confirmed = sorted(name for unit in candidates.values() for name in unit["functions"])
+    configure.SHORT_LOOP_DIR.mkdir(parents=True, exist_ok=True)
+    configure.SHORT_LOOP_STATE_PATH.write_text(json.dumps({"confirmed": confirmed, "checked": {}}), encoding="utf-8")
+
+
+def restore_asm(asm_files: Dict[Path, str]):
+    shutil.rmtree(configure.SHORT_LOOP_DIR, ignore_errors=True)
+    for path, content in asm_files.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+#MARK: Benchmark
+def best_of(repeat: int, run: Callable, setup: Callable = None) -> float:
+    """
+    Return the fastest of repeat runs, in seconds, leaving setup out of the timing.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_size(units: int, repeat: int) -> Dict[str, float]:
+    """
+    Time each phase on a fresh synthetic project of the given size.
+    """
+    workspace = Path(tempfile.mkdtemp(prefix="configbench-"))
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        entries, symbols, asm_files = make_project(units)
+        configure.ROOT = workspace
+        configure.import_splat()
+        configure.splat_symbols.all_symbols = symbols
+        configure.splat_options.opts = SimpleNamespace(
+            nonmatchings_path=workspace / "asm" / "nonmatchings",
+            target_path=workspace / configure.TARGET_PATH,
+        )
+
+        results = {}
+        results["short_loop_candidates"] = best_of(repeat, lambda: configure.short_loop_candidates(entries))
+        candidates = configure.short_loop_candidates(entries)
+        results["select_short_loop_sources"] = best_of(repeat, lambda: configure.select_short_loop_sources(candidates), lambda: confirm_short_loops(candidates))
+        confirm_short_loops(candidates)
+        sources = configure.select_short_loop_sources(candidates)
+        results["stage_short_loop_sources"] = best_of(repeat, lambda: configure.stage_short_loop_sources(sources), lambda: restore_asm(asm_files))
+        restore_asm(asm_files)
+        short_loop = configure.stage_short_loop_sources(sources)
+
+        results["build_model"] = best_of(repeat, lambda: configure.build_model(entries, ""))
+        model = configure.build_model(entries, "")
+
+        results["build_stuff"] = best_of(repeat, lambda: configure.build_stuff(model, configure_args=[], short_loop=short_loop))
+        results["build_stuff_with_objects"] = best_of(repeat, lambda: configure.build_stuff(model, dual_objects=True, configure_args=[], short_loop=short_loop))
+        return results
+    finally:
+        os.chdir(cwd)
+        configure.ROOT = ROOT
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def scaling_ratios(sizes: Dict[int, Dict[str, float]]) -> Dict[str, float]:
+    """
+    Return how much each phase's time per unit grew from the smallest to the largest size.
+    """
+    smallest, largest = min(sizes), max(sizes)
+    return {
+        phase: (sizes[largest][phase] / largest) / max(sizes[smallest][phase] / smallest, 1e-12)
+        for phase in sizes[largest]
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments, runs the benchmark and records the results.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark configure.py's graph generation on synthetic projects")
+    parser.add_argument("--sizes", help="Unit counts to benchmark", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", help="Runs per phase, the fastest is kept", type=int, default=3)
+    parser.add_argument("--max-ratio", help="Fail when a phase's time per unit grows more than this from the smallest to the largest size", type=float, default=DEFAULT_MAX_RATIO)
+    parser.add_argument("--history", help="JSON file the results are appended to", type=Path, default=DEFAULT_HISTORY)
+    args = parser.parse_args()
+
+    sizes: Dict[int, Dict[str, float]] = {}
+    for units in sorted(args.sizes):
+        sizes[units] = bench_size(units, args.repeat)
+        print(f"{units} units:")
+        for phase, seconds in sizes[units].items():
+            print(f"  {phase:<26} {seconds * 1000:>9.1f} ms {seconds / units * 1e6:>7.2f} us/unit")
+
+    history: List[Dict] = []
+    if args.history.exists():
+        with open(args.history, "r", encoding="utf-8") as f:
+            history = json.load(f)
+
+    previous = history[-1] if history else None
+    if previous is not None:
+        print(f"against {previous['commit'] or 'the previous run'}:")
+        for units, phases in sizes.items():
+            for phase, seconds in phases.items():
+                before = previous["sizes"].get(str(units), {}).get(phase)
+                if before:
+                    print(f"  {units:>6} {phase:<26} {(seconds / before - 1) * 100:>+7.1f}%")
+
+    ratios = scaling_ratios(sizes) if len(sizes) > 1 else {}
+    nonlinear = {phase: ratio for phase, ratio in ratios.items() if ratio > args.max_ratio}
+
+    history.append({
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "sizes": {str(units): phases for units, phases in sizes.items()},
+        "scaling": ratios,
+    })
+    args.history.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.history, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+
+    for phase, ratio in nonlinear.items():
+        print(f"ERROR: {phase} scales superlinearly, {ratio:.1f}x the time per unit at {max(sizes)} units as at {min(sizes)}")
+    if nonlinear:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Demangler for CodeWarrior (cfront-style) C++ symbol names, e.g.
+`UpdateJtActive__FP2JTP3JOYf` -> `UpdateJtActive(JT*, JOY*, float)`.
+Returns None for names that aren't mangled or can't be parsed.
+"""
+from typing import List, Optional, Tuple
+
+#MARK: Tables
+BUILTIN_TYPES = {
+    "v": "void",
+    "b": "bool",
+    "c": "char",
+    "w": "wchar_t",
+    "s": "short",
+    "i": "int",
+    "l": "long",
+    "x": "long long",
+    "f": "float",
+    "d": "double",
+    "r": "long double",
+    "e": "...",
+}
+
+OPERATORS = {
+    "nw": "operator new",
+    "dl": "operator delete",
+    "nwa": "operator new[]",
+    "dla": "operator delete[]",
+    "pl": "operator+",
+    "mi": "operator-",
+    "ml": "operator*",
+    "dv": "operator/",
+    "md": "operator%",
+    "er": "operator^",
+    "ad": "operator&",
+    "or": "operator|",
+    "co": "operator~",
+    "nt": "operator!",
+    "as": "operator=",
+    "lt": "operator<",
+    "gt": "operator>",
+    "apl": "operator+=",
+    "ami": "operator-=",
+    "amu": "operator*=",
+    "adv": "operator/=",
+    "amd": "operator%=",
+    "aer": "operator^=",
+    "aad": "operator&=",
+    "aor": "operator|=",
+    "ls": "operator<<",
+    "rs": "operator>>",
+    "als": "operator<<=",
+    "ars": "operator>>=",
+    "eq": "operator==",
+    "ne": "operator!=",
+    "le": "operator<=",
+    "ge": "operator>=",
+    "aa": "operator&&",
+    "oo": "operator||",
+    "pp": "operator++",
+    "mm": "operator--",
+    "cm": "operator,",
+    "rm": "operator->*",
+    "rf": "operator->",
+    "cl": "operator()",
+    "vc": "operator[]",
+}
+
+
+class DemangleError(Exception):
+    pass
+
+#MARK: Parser
+class Parser:
+    """
+    Recursive-descent parser over the mangled suffix of a name.
+    """
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def peek(self) -> str:
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def take(self) -> str:
+        if self.pos >= len(self.text):
+            raise DemangleError("unexpected end")
+        c = self.text[self.pos]
+        self.pos += 1
+        return c
+
+    def number(self) -> int:
+        start = self.pos
+        while self.peek().isdigit():
+            self.pos += 1
+        if start == self.pos:
+            raise DemangleError("expected a number")
+        return int(self.text[start:self.pos])
+
+    def class_name(self) -> str:
+        """
+        A length-prefixed name, or Q<n> followed by n of them.
+        """
+        if self.peek() == "Q":
+            self.take()
+            count = int(self.take())
+            return "::".join(self.class_name() for _ in range(count))
+        length = self.number()
+        name = self.text[self.pos:self.pos + length]
+        if len(name) != length:
+            raise DemangleError("name runs past the end")
+        self.pos += length
+        return name
+
+    def function(self) -> Tuple[List[str], str]:
+        """
+        F<params>_<return>, with the F already consumed.
+        """
+        params = self.parameters(stop="_")
+        self.take()
+        return params, self.type()
+
+    def parameters(self, stop: str = "") -> List[str]:
+        params: List[str] = []
+        while self.pos < len(self.text) and self.peek() != stop:
+            c = self.peek()
+            if c == "T":
+                self.take()
+                params.append(params[int(self.take())])
+            elif c == "N":
+                self.take()
+                count = int(self.take())
+                index = int(self.take())
+                params.extend([params[index]] * count)
+            else:
+                params.append(self.type())
+        return params
+
+    def type(self) -> str:
+        c = self.take()
+        if c in BUILTIN_TYPES:
+            return BUILTIN_TYPES[c]
+        if c == "U":
+            return "unsigned " + self.type()
+        if c == "S":
+            return "signed " + self.type()
+        if c in ("C", "V"):
+            qualifier = "const" if c == "C" else "volatile"
+            inner = self.type()
+            if inner.endswith(("*", "&")):
+                return f"{inner} {qualifier}"
+            return f"{qualifier} {inner}"
+        if c in ("P", "R"):
+            sigil = "*" if c == "P" else "&"
+            if self.peek() == "F":
+                self.take()
+                params, ret = self.function()
+                return f"{ret} ({sigil})({', '.join(p for p in params if p != 'void')})"
+            return self.type() + sigil
+        if c == "A":
+            size = self.number()
+            if self.take() != "_":
+                raise DemangleError("bad array")
+            return f"{self.type()}[{size}]"
+        if c == "M":
+            cls = self.class_name()
+            if self.peek() == "F":
+                self.take()
+                params, ret = self.function()
+                return f"{ret} ({cls}::*)({', '.join(p for p in params if p != 'void')})"
+            return f"{self.type()} {cls}::*"
+        if c.isdigit() or c == "Q":
+            self.pos -= 1
+            return self.class_name()
+        raise DemangleError(f"unknown type code {c}")
+
+#MARK: Demangle
+def special_name(name: str, cls: Optional[str]) -> str:
+    """
+    Turn __ct/__dt/__op.../__<operator> into C++ syntax.
+    """
+    if name == "__ct" and cls:
+        return cls.split("::")[-1]
+    if name == "__dt" and cls:
+        return "~" + cls.split("::")[-1]
+    if name.startswith("__op"):
+        return "operator " + Parser(name[4:]).type()
+    if name.startswith("__") and name[2:] in OPERATORS:
+        return OPERATORS[name[2:]]
+    return name
+
+
+def demangle_at(symbol: str, split: int) -> str:
+    name = symbol[:split]
+    parser = Parser(symbol[split + 2:])
+
+    cls = None
+    if parser.peek().isdigit() or parser.peek() == "Q":
+        cls = parser.class_name()
+
+    const = False
+    if parser.peek() == "C":
+        parser.take()
+        const = True
+
+    qualified = special_name(name, cls)
+    if cls:
+        qualified = f"{cls}::{qualified}"
+
+    if parser.peek() != "F":
+        # Static member or namespaced data
+        if parser.pos != len(parser.text) or not cls:
+            raise DemangleError("trailing characters")
+        return qualified
+
+    parser.take()
+    params = parser.parameters()
+    if params == ["void"]:
+        params = []
+    return f"{qualified}({', '.join(params)}){' const' if const else ''}"
+
+
+def demangle(symbol: str) -> Optional[str]:
+    """
+    Demangle a CodeWarrior C++ name, or return None if it isn't one.
+    """
+    # Skip leading underscores so __ct__/__dt__ and friends split after the special name
+    start = 0
+    while start < len(symbol) and symbol[start] == "_":
+        start += 1
+
+    split = symbol.find("__", start + 1)
+    while split != -1:
+        try:
+            return demangle_at(symbol, split)
+        except (DemangleError, IndexError, ValueError):
+            split = symbol.find("__", split + 1)
+    return None
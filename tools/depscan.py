@@ -0,0 +1,129 @@
+"""
+Pure-Python dependency scanner for the sources the cc and as rules build. Follows `#include`,
+`INCLUDE_ASM(FOLDER, NAME)`/`INCLUDE_RODATA(FOLDER, NAME)` and assembler `.include`/`.incbin`
+directives without invoking the compiler.
+
+Run as a script it writes a Makefile-style depfile for ninja's `deps = gcc`.
+"""
+#! /usr/bin/env python3
+import argparse
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+#MARK: Patterns
+INCLUDE_PATTERN = re.compile(r'^[ \t]*#[ \t]*include[ \t]*[<"]([^>"]+)[>"]', re.MULTILINE)
+INCLUDE_ASM_PATTERN = re.compile(r'\bINCLUDE_(?:ASM|RODATA)\(\s*"([^"]+)"\s*,\s*(\w+)\s*\)')
+ASM_INCLUDE_PATTERN = re.compile(r'\.(?:include|incbin)\s+\\?"([^"\\]+)\\?"')
+
+C_SUFFIXES = {".c", ".cpp", ".cp", ".cxx", ".h", ".hp", ".hpp", ".hxx"}
+ASM_SUFFIXES = {".s", ".S", ".asm", ".inc"}
+
+#MARK: Scanner
+def parse_include_dirs(args: List[str]) -> List[Path]:
+    """
+    Collect the include directories from mwcc (`-i dir`) and gas (`-I dir`, `-Idir`) arguments.
+    """
+    dirs = []
+    for idx, arg in enumerate(args):
+        if arg in ("-i", "-I") and idx + 1 < len(args):
+            dirs.append(Path(args[idx + 1]))
+        elif arg.startswith("-I") and len(arg) > 2:
+            dirs.append(Path(arg[2:]))
+    return dirs
+
+
+def resolve(name: str, search_dirs: Iterable[Path]) -> Optional[Path]:
+    """
+    Return the first existing search_dir/name, or None if it can't be found.
+    """
+    for directory in search_dirs:
+        path = directory / name
+        if path.is_file():
+            return path
+    return None
+
+
+def direct_dependencies(path: Path, include_dirs: List[Path]) -> List[Path]:
+    """
+    Return the files a single source or header pulls in directly.
+    Anything that isn't C/C++ or assembly (e.g. `.incbin` blobs) is a leaf.
+    """
+    if path.suffix not in C_SUFFIXES and path.suffix not in ASM_SUFFIXES:
+        return []
+
+    try:
+        text = path.read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return []
+
+    deps = []
+    if path.suffix in C_SUFFIXES:
+        for name in INCLUDE_PATTERN.findall(text):
+            dep = resolve(name, [path.parent, *include_dirs])
+            if dep is not None:
+                deps.append(dep)
+        for folder, name in INCLUDE_ASM_PATTERN.findall(text):
+            dep = resolve(f"{folder}/{name}.s", [Path(".")])
+            if dep is not None:
+                deps.append(dep)
+
+    # Assembly files, and `__asm__(".include ...")` blocks in C/C++
+    for name in ASM_INCLUDE_PATTERN.findall(text):
+        dep = resolve(name, [Path("."), *include_dirs])
+        if dep is not None:
+            deps.append(dep)
+
+    return deps
+
+
+def scan(sources: Iterable[Path], include_dirs: List[Path], cache: Dict[Path, List[Path]] = None) -> List[Path]:
+    """
+    Return every file reachable from sources, including the sources themselves, sorted.
+    """
+    if cache is None:
+        cache = {}
+
+    seen: Set[Path] = set()
+    stack = [Path(s) for s in sources]
+    while stack:
+        path = stack.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+
+        if path not in cache:
+            cache[path] = direct_dependencies(path, include_dirs)
+        stack.extend(cache[path])
+
+    return sorted(seen)
+
+
+def write_depfile(depfile: Path, target: str, deps: Iterable[Path]) -> None:
+    """
+    Write a Makefile-style depfile listing deps as prerequisites of target.
+    """
+    def escape(path) -> str:
+        return str(path).replace("\\", "/").replace(" ", "\\ ")
+
+    lines = [f"{escape(target)}:"] + [f" {escape(dep)}" for dep in deps]
+    depfile.parent.mkdir(parents=True, exist_ok=True)
+    with depfile.open("w", encoding="utf-8") as f:
+        f.write(" \\\n".join(lines) + "\n")
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments and writes the depfile.
+    """
+    parser = argparse.ArgumentParser(description="Write a depfile for a C/C++ or assembly source")
+    parser.add_argument("-o", "--depfile", help="Depfile to write", type=Path, required=True)
+    parser.add_argument("-t", "--target", help="Target the dependencies belong to", required=True)
+    parser.add_argument("-i", "--include", help="Include directory", action="append", type=Path, default=[])
+    parser.add_argument("sources", nargs="+", type=Path)
+    args = parser.parse_args()
+
+    write_depfile(args.depfile, args.target, scan(args.sources, args.include))
+
+if __name__ == "__main__":
+    main()
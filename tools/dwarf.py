@@ -0,0 +1,267 @@
+"""
+Streaming reader for the DWARF 1 .debug/.line sections CodeWarrior leaves in the original binary.
+Compile units are read lazily from an mmap, following AT_sibling to skip over their children, so
+memory stays bounded and a full scan touches only the top-level entries.
+
+From the compile units it derives the translation unit boundaries of the code segment, emits
+them as splat subsegments and diffs them against the hand-maintained list in the yaml.
+"""
+#! /usr/bin/env python3
+import argparse
+import json
+import re
+import struct
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import yaml
+
+import elffile
+
+#MARK: Constants
+TAG_padding = 0x0000
+TAG_compile_unit = 0x0011
+
+AT_sibling = 0x0012
+AT_name = 0x0038
+AT_stmt_list = 0x0106
+AT_low_pc = 0x0111
+AT_high_pc = 0x0121
+
+FORM_ADDR = 0x1
+FORM_REF = 0x2
+FORM_BLOCK2 = 0x3
+FORM_BLOCK4 = 0x4
+FORM_DATA2 = 0x5
+FORM_DATA4 = 0x6
+FORM_DATA8 = 0x7
+FORM_STRING = 0x8
+
+FIXED_FORM_SIZES = {FORM_ADDR: 4, FORM_REF: 4, FORM_DATA2: 2, FORM_DATA4: 4, FORM_DATA8: 8}
+
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+LINE_ENTRY_SIZE = 10
+
+SUBSEGMENT_LINE = re.compile(r"^\s*(#\s*)?- \[(0x[0-9a-fA-F]+),\s*(\w+),\s*([^\]]+)\]")
+
+#MARK: Types
+class CompileUnit(NamedTuple):
+    offset: int
+    name: str
+    low_pc: Optional[int]
+    high_pc: Optional[int]
+    stmt_list: Optional[int]
+
+
+class Subsegment(NamedTuple):
+    rom: int
+    vram: int
+    name: str
+
+#MARK: .debug
+def read_attributes(data, start: int, end: int) -> Iterator[Tuple[int, object]]:
+    """
+    Lazily decode the attributes of one entry. Block values are returned as (offset, length).
+    """
+    pos = start
+    while pos + 2 <= end:
+        attr = U16.unpack_from(data, pos)[0]
+        pos += 2
+        form = attr & 0xF
+        if form in FIXED_FORM_SIZES:
+            size = FIXED_FORM_SIZES[form]
+            yield attr, int.from_bytes(data[pos:pos + size], "little")
+            pos += size
+        elif form == FORM_STRING:
+            nul = data.find(b"\0", pos, end)
+            if nul < 0:
+                nul = end
+            yield attr, bytes(data[pos:nul]).decode("ascii", errors="replace")
+            pos = nul + 1
+        elif form in (FORM_BLOCK2, FORM_BLOCK4):
+            length_size = 2 if form == FORM_BLOCK2 else 4
+            length = int.from_bytes(data[pos:pos + length_size], "little")
+            pos += length_size
+            yield attr, (pos, length)
+            pos += length
+        else:
+            raise ValueError(f"unknown DWARF form {form:#x} at {pos - 2:#x}")
+
+
+def iter_compile_units(data, debug: elffile.Section) -> Iterator[CompileUnit]:
+    """
+    Lazily yield the compile units of a .debug section, in section order.
+    Entries without an AT_sibling are stepped over one at a time until the next compile unit.
+    """
+    start = debug.offset
+    end = debug.offset + debug.size
+    pos = start
+    while pos + 4 <= end:
+        length = U32.unpack_from(data, pos)[0]
+        if length < 8:
+            # Padding entry
+            pos += max(length, 4)
+            continue
+
+        tag = U16.unpack_from(data, pos + 4)[0]
+        if tag != TAG_compile_unit:
+            pos += length
+            continue
+
+        attributes = dict(read_attributes(data, pos + 6, min(pos + length, end)))
+        yield CompileUnit(
+            pos - start,
+            attributes.get(AT_name, ""),
+            attributes.get(AT_low_pc),
+            attributes.get(AT_high_pc),
+            attributes.get(AT_stmt_list),
+        )
+
+        sibling = attributes.get(AT_sibling)
+        pos = start + sibling if sibling and start + sibling > pos else pos + length
+
+#MARK: .line
+def line_table_range(data, line: elffile.Section, stmt_list: int) -> Optional[Tuple[int, int]]:
+    """
+    Return the [low, high) address range covered by one compile unit's line table.
+    """
+    pos = line.offset + stmt_list
+    if pos + 8 > line.offset + line.size:
+        return None
+    length, base = struct.unpack_from("<II", data, pos)
+    end = min(pos + length, line.offset + line.size)
+    deltas = [U32.unpack_from(data, entry + 6)[0] for entry in range(pos + 8, end - LINE_ENTRY_SIZE + 1, LINE_ENTRY_SIZE)]
+    if not deltas:
+        return None
+    return base, base + max(deltas) + 4
+
+#MARK: Subsegments
+def normalize_name(name: str) -> str:
+    """
+    Turn a compile unit path into a splat segment name: forward slashes, no drive, no suffix.
+    """
+    name = name.replace("\\", "/")
+    name = re.sub(r"^[A-Za-z]:", "", name).lstrip("/")
+    stem, dot, suffix = name.rpartition(".")
+    if dot and "/" not in suffix:
+        name = stem
+    return name
+
+
+def derive_subsegments(binary: Path) -> List[Subsegment]:
+    """
+    Derive the code subsegments from the compile units that cover allocated code.
+    """
+    subsegments: Dict[int, Subsegment] = {}
+    with elffile.open_mmap(binary) as data:
+        sections = elffile.read_sections(data)
+        debug = elffile.find_section(sections, ".debug")
+        line = elffile.find_section(sections, ".line")
+        if debug is None:
+            raise ValueError(f"{binary} has no .debug section")
+        code = [s for s in sections if s.type == elffile.SHT_PROGBITS and s.flags & 0x4 and s.size]
+
+        for cu in iter_compile_units(data, debug):
+            low, high = cu.low_pc, cu.high_pc
+            if (low is None or high is None) and line is not None and cu.stmt_list is not None:
+                low, high = line_table_range(data, line, cu.stmt_list) or (None, None)
+            if low is None or high is None or high <= low:
+                continue
+            for section in code:
+                if section.addr <= low < section.addr + section.size:
+                    rom = section.offset + low - section.addr
+                    # The first unit at an address wins, later ones are usually header-only
+                    subsegments.setdefault(rom, Subsegment(rom, low, normalize_name(cu.name)))
+                    break
+
+    return sorted(subsegments.values())
+
+
+def yaml_subsegments(yaml_path: Path) -> Tuple[Dict[int, Tuple[str, str]], Dict[int, str]]:
+    """
+    Return the yaml's active subsegments ({rom: (type, name)}) and its commented-out ones ({rom: name}).
+    """
+    with open(yaml_path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    active = {}
+    config = yaml.safe_load(text)
+    for seg in config["segments"]:
+        if isinstance(seg, dict):
+            for sub in seg.get("subsegments") or []:
+                if isinstance(sub, list) and len(sub) >= 3:
+                    active[sub[0]] = (sub[1], str(sub[2]))
+
+    commented = {}
+    for line in text.splitlines():
+        m = SUBSEGMENT_LINE.match(line)
+        if m is not None and m.group(1):
+            commented.setdefault(int(m.group(2), 16), m.group(4).strip())
+    return active, commented
+
+
+def diff_subsegments(derived: List[Subsegment], yaml_path: Path) -> Dict:
+    """
+    Compare the derived subsegments against the yaml's.
+    """
+    active, commented = yaml_subsegments(yaml_path)
+    derived_by_rom = {s.rom: s for s in derived}
+    code_types = {"asmtu", "asm", "c", "cpp"}
+
+    missing = []
+    renamed = []
+    for sub in derived:
+        if sub.rom not in active:
+            missing.append({"rom": sub.rom, "vram": sub.vram, "name": sub.name, "commented_out_as": commented.get(sub.rom)})
+        elif active[sub.rom][1] != sub.name:
+            renamed.append({"rom": sub.rom, "vram": sub.vram, "name": sub.name, "yaml_name": active[sub.rom][1]})
+
+    extra = [
+        {"rom": rom, "type": seg_type, "name": name}
+        for rom, (seg_type, name) in sorted(active.items())
+        if seg_type in code_types and rom not in derived_by_rom
+    ]
+    return {"derived": len(derived), "missing": missing, "renamed": renamed, "extra": extra}
+
+
+def format_subsegment(sub: Subsegment) -> str:
+    return f"      - [0x{sub.rom:06X}, asmtu, {sub.name}] # vram: 0x{sub.vram:08X}"
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments, derives the subsegments and diffs them against the yaml.
+    """
+    parser = argparse.ArgumentParser(description="Derive translation unit boundaries from the DWARF 1 debug info")
+    parser.add_argument("--binary", help="Original binary", type=Path, required=True)
+    parser.add_argument("--yaml", help="splat config to diff against", type=Path)
+    parser.add_argument("-o", "--output", help="Write the derived subsegments in splat yaml syntax", type=Path)
+    parser.add_argument("--json", help="Write the diff against the yaml as JSON", type=Path)
+    args = parser.parse_args()
+
+    derived = derive_subsegments(args.binary)
+    print(f"dwarf: {len(derived)} translation units with code")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(format_subsegment(s) for s in derived) + "\n")
+
+    if args.yaml is None:
+        return
+
+    diff = diff_subsegments(derived, args.yaml)
+    for sub in diff["missing"]:
+        note = f" (commented out as {sub['commented_out_as']})" if sub["commented_out_as"] else ""
+        print(f"missing: 0x{sub['rom']:06X} {sub['name']}{note}")
+    for sub in diff["renamed"]:
+        print(f"renamed: 0x{sub['rom']:06X} {sub['yaml_name']} -> {sub['name']}")
+    for sub in diff["extra"]:
+        print(f"not a unit in the debug info: 0x{sub['rom']:06X} {sub['name']}")
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(diff, f, indent=2)
+
+if __name__ == "__main__":
+    main()
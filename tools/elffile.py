@@ -0,0 +1,157 @@
+"""
+Minimal reader for little-endian ELF32 files (the PS2 EE objects and executables this project
+builds). Works directly on bytes or an mmap, so large files are never copied into Python objects.
+"""
+import mmap
+import struct
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Union
+
+#MARK: Constants
+SHT_NULL = 0
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+SHT_NOBITS = 8
+SHT_REL = 9
+
+SHN_UNDEF = 0
+SHN_ABS = 0xFFF1
+SHN_COMMON = 0xFFF2
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STB_WEAK = 2
+
+STT_NOTYPE = 0
+STT_OBJECT = 1
+STT_FUNC = 2
+STT_SECTION = 3
+STT_FILE = 4
+
+SYMBOL_TYPES = {STT_NOTYPE: "notype", STT_OBJECT: "object", STT_FUNC: "func", STT_SECTION: "section", STT_FILE: "file"}
+
+R_MIPS_NONE = 0
+R_MIPS_32 = 2
+R_MIPS_26 = 4
+R_MIPS_HI16 = 5
+R_MIPS_LO16 = 6
+R_MIPS_GPREL16 = 7
+R_MIPS_LITERAL = 8
+R_MIPS_PC16 = 10
+
+ELF_HEADER = struct.Struct("<16sHHIIIIIHHHHHH")
+SECTION_HEADER = struct.Struct("<IIIIIIIIII")
+SYMBOL = struct.Struct("<IIIBBH")
+REL = struct.Struct("<II")
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+#MARK: Types
+class Section(NamedTuple):
+    index: int
+    name: str
+    type: int
+    flags: int
+    addr: int
+    offset: int
+    size: int
+    link: int
+    info: int
+    entsize: int
+
+
+class Symbol(NamedTuple):
+    name: str
+    value: int
+    size: int
+    bind: int
+    type: int
+    shndx: int
+
+
+class Relocation(NamedTuple):
+    offset: int
+    type: int
+    symbol: int
+
+#MARK: Reader
+@contextmanager
+def open_mmap(path: Path):
+    """
+    Memory-map a file read-only.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def read_cstring(data: Buffer, offset: int) -> str:
+    """
+    Read a NUL-terminated string starting at offset.
+    """
+    end = data.find(b"\0", offset)
+    if end < 0:
+        end = len(data)
+    return bytes(data[offset:end]).decode("ascii", errors="replace")
+
+
+def read_sections(data: Buffer) -> List[Section]:
+    """
+    Parse the section header table, resolving section names.
+    """
+    ident, _, _, _, _, _, shoff, _, _, _, _, shentsize, shnum, shstrndx = ELF_HEADER.unpack_from(data, 0)
+    if ident[:4] != b"\x7fELF" or ident[4] != 1 or ident[5] != 1:
+        raise ValueError("Not a little-endian ELF32 file")
+
+    raw = [SECTION_HEADER.unpack_from(data, shoff + i * shentsize) for i in range(shnum)]
+    names_offset = raw[shstrndx][4] if shstrndx < len(raw) else 0
+
+    return [
+        Section(i, read_cstring(data, names_offset + h[0]), h[1], h[2], h[3], h[4], h[5], h[6], h[7], h[9])
+        for i, h in enumerate(raw)
+    ]
+
+
+def find_section(sections: List[Section], name: str, section_type: Optional[int] = None) -> Optional[Section]:
+    """
+    Return the first section with the given name (and type, if given).
+    """
+    for section in sections:
+        if section.name == name and (section_type is None or section.type == section_type):
+            return section
+    return None
+
+
+def section_data(data: Buffer, section: Section) -> bytes:
+    """
+    Return a section's contents (empty for NOBITS sections).
+    """
+    if section.type == SHT_NOBITS:
+        return b""
+    return bytes(data[section.offset:section.offset + section.size])
+
+
+def iter_symbols(data: Buffer, sections: List[Section], symtab: Section) -> Iterator[Symbol]:
+    """
+    Lazily yield the symbols of a SYMTAB section.
+    """
+    strtab = sections[symtab.link]
+    entsize = symtab.entsize or SYMBOL.size
+    for offset in range(symtab.offset, symtab.offset + symtab.size, entsize):
+        name, value, size, info, _, shndx = SYMBOL.unpack_from(data, offset)
+        yield Symbol(read_cstring(data, strtab.offset + name), value, size, info >> 4, info & 0xF, shndx)
+
+
+def iter_relocations(data: Buffer, section: Section) -> Iterator[Relocation]:
+    """
+    Lazily yield the entries of a REL section.
+    """
+    if section.type != SHT_REL:
+        raise ValueError(f"{section.name} is not a REL section")
+    entsize = section.entsize or REL.size
+    for offset in range(section.offset, section.offset + section.size, entsize):
+        r_offset, r_info = REL.unpack_from(data, offset)
+        yield Relocation(r_offset, r_info & 0xFF, r_info >> 8)
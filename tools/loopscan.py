@@ -0,0 +1,152 @@
+"""
+Find the functions hit by the short loop bug. The R5900 can misexecute loops of six instructions
+or fewer, so mwccps2's inline assembler pads such loops with nops; the original build had them
+compiled, unpadded, so their INCLUDE_ASM'd asm only matches with the branches as raw opcodes.
+
+A function is a candidate when it contains a backward branch (the branch set tools/shortloop.py
+patches) closing a loop of at most SHORT_LOOP_LENGTH instructions, delay slot included. The
+instruction words are decoded with NumPy in one batch, so the whole binary takes well under a
+second. The loop shape alone over-approximates, so a candidate is only confirmed by its compiled
+object: compiled from the unpatched asm, the padding makes the function longer than the original.
+"""
+#! /usr/bin/env python3
+import argparse
+import bisect
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+import elffile
+import shortloop
+
+#MARK: Constants
+SHORT_LOOP_LENGTH = 6
+
+REGIMM_OPCODE = 0x01
+# (opcode, REGIMM rt) of each branch mnemonic; b, beqz and bnez are beq/bne aliases
+BRANCH_ENCODINGS = {
+    "beq": (0x04, None), "b": (0x04, None), "beqz": (0x04, None),
+    "bne": (0x05, None), "bnez": (0x05, None),
+    "blez": (0x06, None), "bgtz": (0x07, None),
+    "beql": (0x14, None), "beqzl": (0x14, None),
+    "bnel": (0x15, None), "bnezl": (0x15, None),
+    "blezl": (0x16, None), "bgtzl": (0x17, None),
+    "bltz": (REGIMM_OPCODE, 0x00), "bgez": (REGIMM_OPCODE, 0x01),
+    "bltzl": (REGIMM_OPCODE, 0x02), "bgezl": (REGIMM_OPCODE, 0x03),
+}
+# Derived from the patched set, so a branch that's detected is always one that gets patched
+BRANCH_OPCODES = np.array(sorted({BRANCH_ENCODINGS[m][0] for m in shortloop.BRANCH_MNEMONICS if BRANCH_ENCODINGS[m][1] is None}), dtype=np.uint32)
+REGIMM_BRANCHES = np.array(sorted({BRANCH_ENCODINGS[m][1] for m in shortloop.BRANCH_MNEMONICS if BRANCH_ENCODINGS[m][1] is not None}), dtype=np.uint32)
+
+SHF_EXECINSTR = 0x4
+
+#MARK: Scan
+def decode_words(data) -> np.ndarray:
+    """
+    Decode little-endian instruction words in one go. The bytes are copied, so no view into
+    an mmap outlives it.
+    """
+    return np.frombuffer(bytes(data[:len(data) & ~3]), dtype="<u4")
+
+
+def short_loop_branches(data, vram: int) -> List[int]:
+    """
+    Return the addresses of the branches closing short loops in a block of code, sorted.
+    """
+    words = decode_words(data)
+    op = words >> 26
+    branch = np.isin(op, BRANCH_OPCODES) | ((op == REGIMM_OPCODE) & np.isin((words >> 16) & 0x1F, REGIMM_BRANCHES))
+    offset = words & 0xFFFF
+    # Backward, and from the target to the delay slot, (i + 1) - (i + 1 + offset) + 1, is short
+    short = ((offset & 0x8000) != 0) & (0x10000 - offset + 1 <= SHORT_LOOP_LENGTH)
+    return (vram + np.nonzero(branch & short)[0] * 4).tolist()
+
+
+def affected_functions(data, vram: int, functions: Iterable[Tuple[str, int, int]]) -> Set[str]:
+    """
+    Return the names of the (name, vram, size) functions within the code block that contain a short loop.
+    """
+    branches = short_loop_branches(data, vram)
+    affected = set()
+    for name, start, size in functions:
+        idx = bisect.bisect_left(branches, start)
+        if idx < len(branches) and branches[idx] < start + size:
+            affected.add(name)
+    return affected
+
+#MARK: Sources
+def binary_functions(binary: Path) -> Set[str]:
+    """
+    Scan every executable section of an ELF against its sized function symbols.
+    """
+    affected = set()
+    with elffile.open_mmap(binary) as data:
+        sections = elffile.read_sections(data)
+        symtab = elffile.find_section(sections, ".symtab", elffile.SHT_SYMTAB)
+        if symtab is None:
+            return affected
+
+        functions: Dict[int, List[Tuple[str, int, int]]] = {}
+        for sym in elffile.iter_symbols(data, sections, symtab):
+            if sym.type == elffile.STT_FUNC and sym.size and sym.shndx < len(sections):
+                functions.setdefault(sym.shndx, []).append((sym.name, sym.value, sym.size))
+
+        for section in sections:
+            if section.type != elffile.SHT_PROGBITS or not section.flags & SHF_EXECINSTR:
+                continue
+            if section.index in functions:
+                affected |= affected_functions(elffile.section_data(data, section), section.addr, functions[section.index])
+    return affected
+
+
+def function_sizes(path: Path) -> Dict[str, int]:
+    """
+    Return the sizes of the sized function symbols of an ELF file.
+    """
+    with elffile.open_mmap(path) as data:
+        sections = elffile.read_sections(data)
+        symtab = elffile.find_section(sections, ".symtab", elffile.SHT_SYMTAB)
+        if symtab is None:
+            return {}
+        return {sym.name: sym.size for sym in elffile.iter_symbols(data, sections, symtab) if sym.type == elffile.STT_FUNC and sym.size}
+
+
+def confirmed_functions(candidates: Dict[str, int], obj: Path) -> Set[str]:
+    """
+    Return the candidates, given as {name: original size}, that the compiled object has padded,
+    i.e. that came out longer than in the original binary.
+    """
+    compiled = function_sizes(obj)
+    return {name for name, size in candidates.items() if compiled.get(name, 0) > size}
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments and reports the affected functions.
+    """
+    parser = argparse.ArgumentParser(description="Find the functions hit by the short loop bug")
+    parser.add_argument("--binary", help="Original binary", type=Path, required=True)
+    parser.add_argument("--object", help="Compiled object to confirm against (repeatable)", type=Path, action="append", default=[])
+    parser.add_argument("-o", "--output", help="JSON file to write the results to", type=Path)
+    args = parser.parse_args()
+
+    affected = binary_functions(args.binary)
+
+    confirmed = set()
+    if args.object:
+        target_sizes = function_sizes(args.binary)
+        candidates = {name: target_sizes[name] for name in affected if name in target_sizes}
+        for obj in args.object:
+            confirmed |= confirmed_functions(candidates, obj)
+
+    for name in sorted(affected):
+        print(f"{name}{' (confirmed)' if name in confirmed else ''}")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"affected": sorted(affected), "confirmed": sorted(confirmed)}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Parser for GNU ld map files. Records where each object's input sections ended up, both in
+memory (VMA) and in the final raw binary (the load address, since objcopy -O binary lays the
+image out by LMA and this project's image starts at 0).
+"""
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+#MARK: Patterns
+OUTPUT_SECTION = re.compile(r"^(\S+)(?:\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)(?:\s+load address 0x([0-9a-fA-F]+))?)?\s*$")
+INPUT_SECTION = re.compile(r"^ (\S+)(?:\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)\s+(\S.*?))?\s*$")
+CONTINUATION = re.compile(r"^\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)(?:\s+load address 0x([0-9a-fA-F]+)|\s+(\S.*?))?\s*$")
+SYMBOL = re.compile(r"^\s+0x([0-9a-fA-F]+)\s+([A-Za-z_.$][\w.$]*)\s*$")
+
+# Input sections that take no space in the image
+NOLOAD_SECTIONS = {".bss", ".sbss", "COMMON", ".scommon"}
+
+#MARK: Types
+class InputSection(NamedTuple):
+    name: str
+    object: str
+    vma: int
+    size: int
+    offset: int
+
+
+class OutputSection(NamedTuple):
+    name: str
+    vma: int
+    size: int
+    lma: int
+
+#MARK: Parser
+def iter_map(path: Path) -> Iterator[object]:
+    """
+    Lazily yield the output and input sections of a map file, in file order.
+    """
+    out: Optional[OutputSection] = None
+    pending_output: Optional[str] = None
+    pending_input: Optional[str] = None
+    in_memory_map = False
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not in_memory_map:
+                in_memory_map = line.startswith("Linker script and memory map")
+                continue
+
+            if not line.strip():
+                continue
+
+            if not line[0].isspace():
+                m = OUTPUT_SECTION.match(line)
+                if m is None:
+                    continue
+                pending_input = None
+                if m.group(2) is None:
+                    pending_output = m.group(1)
+                    continue
+                pending_output = None
+                vma = int(m.group(2), 16)
+                lma = int(m.group(4), 16) if m.group(4) else vma
+                out = OutputSection(m.group(1), vma, int(m.group(3), 16), lma)
+                yield out
+                continue
+
+            m = CONTINUATION.match(line)
+            if m is not None and (pending_output or pending_input):
+                vma, size = int(m.group(1), 16), int(m.group(2), 16)
+                if pending_output:
+                    lma = int(m.group(3), 16) if m.group(3) else vma
+                    out = OutputSection(pending_output, vma, size, lma)
+                    pending_output = None
+                    yield out
+                elif m.group(4) and out is not None:
+                    yield InputSection(pending_input, m.group(4), vma, size, vma - out.vma + out.lma)
+                    pending_input = None
+                continue
+
+            if SYMBOL.match(line):
+                continue
+
+            m = INPUT_SECTION.match(line)
+            if m is None or m.group(1).startswith("*"):
+                pending_input = None
+                continue
+            if m.group(2) is None:
+                pending_input = m.group(1)
+                continue
+            pending_input = None
+            if out is not None:
+                vma = int(m.group(2), 16)
+                yield InputSection(m.group(1), m.group(4), vma, int(m.group(3), 16), vma - out.vma + out.lma)
+
+
+def object_sections(path: Path, include_noload: bool = False) -> Dict[str, List[InputSection]]:
+    """
+    Group the non-empty input sections of a map file by object, in link order.
+    Sections that take no space in the image are skipped unless include_noload is True.
+    """
+    objects: Dict[str, List[InputSection]] = {}
+    for item in iter_map(path):
+        if not isinstance(item, InputSection):
+            continue
+        if item.size == 0 or (item.name in NOLOAD_SECTIONS and not include_noload):
+            continue
+        objects.setdefault(item.object, []).append(item)
+    return objects
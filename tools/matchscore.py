@@ -0,0 +1,220 @@
+"""
+Rank nonmatching functions by how close they are to matching. Every function's target words come
+from the objdiff target objects (the assembled split asm) and its current words from the objdiff
+base objects (obj/current, built with --objects or --with-objects), with the relocated fields of
+both masked out. All functions are then scored in one batch of NumPy operations:
+
+    match     the share of words equal at the same position, relative to the longer side
+    distance  the bag distance of the two word multisets, a cheap lower bound on the edit
+              distance that shifted code (an extra or missing instruction) doesn't blow up
+"""
+#! /usr/bin/env python3
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+import elffile
+
+#MARK: Constants
+SHF_EXECINSTR = 0x4
+OBJDIFF_PATH = Path("objdiff.json")
+SORT_KEYS = ("match", "distance", "size", "name")
+
+REL_DTYPE = np.dtype([("offset", "<u4"), ("info", "<u4")])
+
+# Bits of an instruction word each relocation type fills in
+RELOC_MASKS = np.full(256, 0xFFFFFFFF, dtype=np.uint32)
+RELOC_MASKS[elffile.R_MIPS_32] = 0
+RELOC_MASKS[elffile.R_MIPS_26] = ~np.uint32(0x03FFFFFF)
+for reloc_type in (elffile.R_MIPS_HI16, elffile.R_MIPS_LO16, elffile.R_MIPS_GPREL16, elffile.R_MIPS_LITERAL, elffile.R_MIPS_PC16):
+    RELOC_MASKS[reloc_type] = ~np.uint32(0xFFFF)
+
+#MARK: Objects
+class Unit(NamedTuple):
+    name: str
+    categories: List[str]
+    target_path: Path
+    base_path: Path
+
+
+def load_object(path: Path) -> Tuple[np.ndarray, Dict[str, Tuple[int, int]]]:
+    """
+    Return the relocation-masked words of an object's code sections, concatenated, and its
+    functions as {name: (first word, word count)} into them.
+    """
+    # Objects are small, and NumPy views into an mmap would keep it from closing
+    data = path.read_bytes()
+    sections = elffile.read_sections(data)
+
+    chunks = []
+    section_base: Dict[int, int] = {}
+    position = 0
+    for section in sections:
+        if section.type == elffile.SHT_PROGBITS and section.flags & SHF_EXECINSTR and section.size >= 4:
+            section_base[section.index] = position
+            chunks.append(np.frombuffer(data, dtype="<u4", count=section.size // 4, offset=section.offset))
+            position += section.size // 4
+    # concatenate copies, so the words are writable
+    words = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint32)
+
+    for section in sections:
+        if section.type == elffile.SHT_REL and section.info in section_base:
+            entries = np.frombuffer(data, dtype=REL_DTYPE, count=section.size // REL_DTYPE.itemsize, offset=section.offset)
+            indices = section_base[section.info] + (entries["offset"] // 4).astype(np.int64)
+            in_range = indices < len(words)
+            words[indices[in_range]] &= RELOC_MASKS[entries["info"][in_range] & 0xFF]
+
+    functions = {}
+    symtab = elffile.find_section(sections, ".symtab", elffile.SHT_SYMTAB)
+    if symtab is not None:
+        for sym in elffile.iter_symbols(data, sections, symtab):
+            if sym.type == elffile.STT_FUNC and sym.size and sym.shndx in section_base:
+                functions[sym.name] = (section_base[sym.shndx] + sym.value // 4, sym.size // 4)
+    return words, functions
+
+
+def read_units(objdiff_path: Path) -> Tuple[List[Unit], Dict[str, str]]:
+    """
+    Return the units of objdiff.json and its {category id: name} map.
+    """
+    with open(objdiff_path, "r", encoding="utf-8") as f:
+        objdiff = json.load(f)
+    units = [
+        Unit(
+            unit["name"],
+            unit.get("metadata", {}).get("progress_categories", []),
+            Path(unit["target_path"]),
+            Path(unit["base_path"]) if "base_path" in unit else None,
+        )
+        for unit in objdiff["units"]
+    ]
+    categories = {c["id"]: c["name"] for c in objdiff.get("progress_categories", [])}
+    return units, categories
+
+#MARK: Scoring
+def ranges(starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Expand per-function (start, length) ranges into flat word indices and the function each belongs to.
+    """
+    owners = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return starts[owners] + offsets, owners
+
+
+def score(target: np.ndarray, current: np.ndarray, t_start: np.ndarray, t_len: np.ndarray, c_start: np.ndarray, c_len: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every function at once. Returns the match ratios and the bag distances.
+    """
+    count = len(t_len)
+    longest = np.maximum(t_len, c_len)
+
+    # Words equal at the same position
+    t_idx, owners = ranges(t_start, np.minimum(t_len, c_len))
+    c_idx, _ = ranges(c_start, np.minimum(t_len, c_len))
+    matches = np.bincount(owners, weights=target[t_idx] == current[c_idx], minlength=count)
+    ratio = np.divide(matches, longest, out=np.ones(count), where=longest > 0)
+
+    # Words the two sides have in common regardless of position, as (function, word) multisets
+    t_idx, t_owners = ranges(t_start, t_len)
+    c_idx, c_owners = ranges(c_start, c_len)
+    t_keys, t_counts = np.unique((t_owners.astype(np.uint64) << np.uint64(32)) | target[t_idx], return_counts=True)
+    c_keys, c_counts = np.unique((c_owners.astype(np.uint64) << np.uint64(32)) | current[c_idx], return_counts=True)
+    common_keys, t_common, c_common = np.intersect1d(t_keys, c_keys, assume_unique=True, return_indices=True)
+    common = np.bincount(
+        (common_keys >> np.uint64(32)).astype(np.int64),
+        weights=np.minimum(t_counts[t_common], c_counts[c_common]),
+        minlength=count,
+    )
+    return ratio, (longest - common).astype(np.int64)
+
+
+def score_units(units: List[Unit]) -> List[Dict]:
+    """
+    Load every unit's objects and score all of their functions in one batch.
+    """
+    target_chunks, current_chunks = [], []
+    t_base = c_base = 0
+    records = []
+    starts = []
+    for unit in units:
+        if not unit.target_path.exists():
+            continue
+        t_words, t_functions = load_object(unit.target_path)
+        c_words, c_functions = np.empty(0, dtype=np.uint32), {}
+        if unit.base_path is not None and unit.base_path.exists():
+            c_words, c_functions = load_object(unit.base_path)
+
+        for name, (t_first, t_count) in t_functions.items():
+            c_first, c_count = c_functions.get(name, (0, 0))
+            records.append({"name": name, "unit": unit.name, "categories": unit.categories, "size": t_count * 4})
+            starts.append((t_base + t_first, t_count, c_base + c_first, c_count))
+
+        target_chunks.append(t_words)
+        current_chunks.append(c_words)
+        t_base += len(t_words)
+        c_base += len(c_words)
+
+    if not records:
+        return []
+
+    target = np.concatenate(target_chunks)
+    current = np.concatenate(current_chunks) if c_base else np.zeros(1, dtype=np.uint32)
+    t_start, t_len, c_start, c_len = (np.array(column, dtype=np.int64) for column in zip(*starts))
+    ratio, distance = score(target, current, t_start, t_len, c_start, c_len)
+
+    for record, r, d, compiled in zip(records, ratio.tolist(), distance.tolist(), c_len.tolist()):
+        record["match_percent"] = round(r * 100, 2)
+        record["distance"] = d
+        record["compiled"] = compiled > 0
+    return records
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments, scores the functions and prints or writes the ranking.
+    """
+    parser = argparse.ArgumentParser(description="Rank nonmatching functions by how close they are to matching")
+    parser.add_argument("--objdiff", help="objdiff.json listing the target and base objects", type=Path, default=OBJDIFF_PATH)
+    parser.add_argument("-c", "--category", help="Only functions in this progress category, by id or name (repeatable)", action="append")
+    parser.add_argument("-s", "--sort", help="Order of the ranking (match: closest first)", choices=SORT_KEYS, default="match")
+    parser.add_argument("-n", "--top", help="Number of functions to print", type=int, default=50)
+    parser.add_argument("-a", "--all", help="Include functions that already match", action="store_true")
+    parser.add_argument("-o", "--output", help="Write the full ranking as JSON", type=Path)
+    args = parser.parse_args()
+
+    if not args.objdiff.exists():
+        print(f"{args.objdiff} not found, run configure.py with --objects or --with-objects first")
+        sys.exit(1)
+
+    units, categories = read_units(args.objdiff)
+    if args.category:
+        by_name = {name.lower(): id for id, name in categories.items()}
+        wanted = {by_name.get(c.lower(), c) for c in args.category}
+        units = [u for u in units if wanted & set(u.categories)]
+
+    records = score_units(units)
+    if not args.all:
+        records = [r for r in records if r["match_percent"] < 100]
+
+    sort_keys = {
+        "match": lambda r: (-r["match_percent"], r["distance"], r["name"]),
+        "distance": lambda r: (r["distance"], -r["match_percent"], r["name"]),
+        "size": lambda r: (r["size"], -r["match_percent"], r["name"]),
+        "name": lambda r: r["name"],
+    }
+    records.sort(key=sort_keys[args.sort])
+
+    for record in records[:args.top]:
+        print(f"{record['match_percent']:>6.2f}% {record['distance']:>6} {record['size']:>7}  {record['name']} ({record['unit']})")
+    print(f"{len(records)} functions")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"functions": records}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Compile server for mwccps2 under Wine. The server keeps a persistent wineserver running in
+one initialized prefix, so compiles skip the prefix and wineserver startup, and runs each job
+as its own wine process, a bounded number at a time; the client is the thin command the `cc`
+ninja rule calls instead of invoking wine directly, and runs wine itself when the server isn't
+there or goes away mid-job.
+"""
+#! /usr/bin/env python3
+import argparse
+import base64
+import json
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+#MARK: Constants
+ROOT = Path(__file__).parent.parent.resolve()
+WINE = "wine"
+WINESERVER = "wineserver"
+SOCKET_PATH = Path(os.environ.get("MWCC_SERVER_SOCKET", ROOT / ".mwcc_server.sock"))
+DEFAULT_JOBS = os.cpu_count() or 1
+
+#MARK: Protocol
+def send_message(sock: socket.socket, message: Dict) -> None:
+    """
+    Send a length-prefixed JSON message.
+    """
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(struct.pack("<I", len(data)) + data)
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    """
+    Read exactly size bytes from the socket.
+    """
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket) -> Dict:
+    """
+    Receive a length-prefixed JSON message.
+    """
+    (size,) = struct.unpack("<I", recv_exact(sock, 4))
+    return json.loads(recv_exact(sock, size).decode("utf-8"))
+
+
+def run_compiler(args: List[str], cwd: str, env: Dict[str, str]) -> Dict:
+    """
+    Run one compile job exactly as the plain `cc` rule would, and capture its output.
+    """
+    proc = subprocess.run([WINE] + args, cwd=cwd, env=env, capture_output=True)
+    return {
+        "returncode": proc.returncode,
+        "stdout": base64.b64encode(proc.stdout).decode("ascii"),
+        "stderr": base64.b64encode(proc.stderr).decode("ascii"),
+    }
+
+#MARK: Server
+class CompileHandler(socketserver.BaseRequestHandler):
+    """
+    Handle one client connection: a single compile job or a shutdown request.
+    """
+    def handle(self):
+        request = recv_message(self.request)
+
+        if request.get("cmd") == "shutdown":
+            send_message(self.request, {"returncode": 0})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+
+        env = dict(request["env"])
+        if self.server.wineprefix:
+            env["WINEPREFIX"] = self.server.wineprefix
+
+        with self.server.slots:
+            response = run_compiler(request["args"], request["cwd"], env)
+        send_message(self.request, response)
+
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, jobs: int, wineprefix: str):
+        self.slots = threading.BoundedSemaphore(jobs)
+        self.wineprefix = wineprefix
+        super().__init__(str(path), CompileHandler)
+
+
+def serve(jobs: int, wineprefix: str) -> None:
+    """
+    Initialize the Wine prefix, keep a persistent wineserver alive and serve compile jobs.
+    """
+    env = dict(os.environ)
+    if wineprefix:
+        env["WINEPREFIX"] = wineprefix
+
+    # Initialize the prefix once so the first compile doesn't pay for it
+    subprocess.run([WINE, "wineboot", "--init"], env=env, capture_output=True)
+    wineserver = subprocess.Popen([WINESERVER, "--persistent", "--foreground"], env=env)
+
+    if SOCKET_PATH.exists():
+        SOCKET_PATH.unlink()
+
+    try:
+        with CompileServer(SOCKET_PATH, jobs, wineprefix) as server:
+            print(f"mwcc server listening on {SOCKET_PATH}, running up to {jobs} compiles at once")
+            server.serve_forever()
+    finally:
+        if SOCKET_PATH.exists():
+            SOCKET_PATH.unlink()
+        wineserver.terminate()
+        wineserver.wait()
+
+#MARK: Client
+def connect():
+    """
+    Connect to the compile server, or return None if it isn't running.
+    """
+    if not SOCKET_PATH.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(SOCKET_PATH))
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def output_path(args: List[str]) -> Optional[Path]:
+    """
+    Return the object a compile job writes, from its -o argument.
+    """
+    for i, arg in enumerate(args[:-1]):
+        if arg == "-o":
+            return Path(args[i + 1])
+    return None
+
+
+def compile_remote(args: List[str]) -> int:
+    """
+    Send a compile job to the server, falling back to running wine locally if it isn't up or
+    drops the job before answering.
+    """
+    sock = connect()
+    if sock is None:
+        return subprocess.run([WINE] + args).returncode
+
+    try:
+        with sock:
+            send_message(sock, {"cwd": os.getcwd(), "env": dict(os.environ), "args": args})
+            response = recv_message(sock)
+    except (OSError, ValueError):
+        # The server may have died partway through writing the object; don't leave a truncated
+        # one behind for the local compile
+        print("mwcc server went away, compiling locally", file=sys.stderr)
+        output = output_path(args)
+        if output is not None:
+            output.unlink(missing_ok=True)
+        return subprocess.run([WINE] + args).returncode
+
+    sys.stdout.buffer.write(base64.b64decode(response["stdout"]))
+    sys.stderr.buffer.write(base64.b64decode(response["stderr"]))
+    return response["returncode"]
+
+
+def stop() -> int:
+    """
+    Ask a running server to shut down.
+    """
+    sock = connect()
+    if sock is None:
+        print("mwcc server is not running")
+        return 1
+    with sock:
+        send_message(sock, {"cmd": "shutdown"})
+        recv_message(sock)
+    return 0
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments and runs the server or client.
+    """
+    parser = argparse.ArgumentParser(description="mwccps2 compile server for Wine")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Start the compile server")
+    serve_parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of compiles to run at once (defaults to the CPU count, like ninja)",
+        type=int,
+        default=DEFAULT_JOBS,
+    )
+    serve_parser.add_argument(
+        "--wineprefix",
+        help="Wine prefix to compile in (defaults to $WINEPREFIX)",
+        default=os.environ.get("WINEPREFIX", ""),
+    )
+
+    cc_parser = subparsers.add_parser("cc", help="Compile through the server")
+    cc_parser.add_argument("args", nargs=argparse.REMAINDER)
+
+    subparsers.add_parser("stop", help="Stop the compile server")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.jobs, args.wineprefix)
+    elif args.command == "cc":
+        compiler_args = args.args
+        if compiler_args and compiler_args[0] == "--":
+            compiler_args = compiler_args[1:]
+        sys.exit(compile_remote(compiler_args))
+    elif args.command == "stop":
+        sys.exit(stop())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Content-addressed object cache for the cc and as rules, in the style of ccache.
+
+Objects are keyed on the contents of every file the source pulls in (see depscan.py), the
+command line after the compiler with the output path masked, and the compiler binary. Paths
+under the checkout are keyed relative to it, so checkouts in different places share objects.
+The cache lives outside the tree so it survives `configure.py --clean`.
+
+Environment:
+    SR2_OBJCACHE_DIR       writable cache directory (default: ~/.cache/sr2-objcache)
+    SR2_OBJCACHE_MAX_SIZE  size cap in bytes, least recently used objects are evicted (default: 5 GiB)
+    SR2_OBJCACHE_SHARED    read-only cache directory consulted after the local one, e.g. one CI populated
+"""
+#! /usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+
+import depscan
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#MARK: Constants
+ROOT = Path(__file__).parent.parent.resolve()
+CACHE_DIR = Path(os.environ.get("SR2_OBJCACHE_DIR", Path.home() / ".cache" / "sr2-objcache"))
+SHARED_DIR = os.environ.get("SR2_OBJCACHE_SHARED")
+MAX_SIZE = int(os.environ.get("SR2_OBJCACHE_MAX_SIZE", 5 * 1024 ** 3))
+CACHE_VERSION = "2"
+
+#MARK: Stats
+@contextmanager
+def locked_stats(cache_dir: Path):
+    """
+    Open the stats file under an exclusive lock and write it back on exit.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(cache_dir / "stats.lock", "a+") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        stats_path = cache_dir / "stats.json"
+        try:
+            stats = json.loads(stats_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            stats = {"hits": 0, "shared_hits": 0, "misses": 0, "uncacheable": 0, "size": 0}
+        yield stats
+        tmp_path = stats_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(stats, indent=2), encoding="utf-8")
+        os.replace(tmp_path, stats_path)
+
+
+def count(cache_dir: Path, stat: str, size: int = 0) -> int:
+    """
+    Increment a counter and the tracked cache size, returning the new size.
+    """
+    with locked_stats(cache_dir) as stats:
+        stats[stat] = stats.get(stat, 0) + 1
+        stats["size"] = stats.get("size", 0) + size
+        return stats["size"]
+
+#MARK: Keys
+def hash_file(h, path: Path) -> None:
+    """
+    Feed a file's contents into a hash, in chunks.
+    """
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+
+def split_output(args: List[str]):
+    """
+    Return the output path, the gas `--MD` depfile path and the arguments with both masked.
+    """
+    output = None
+    depfile = None
+    masked = []
+    for idx, arg in enumerate(args):
+        if idx > 0 and args[idx - 1] == "-o":
+            output = arg
+            masked.append("$out")
+        elif idx > 0 and args[idx - 1] == "--MD":
+            depfile = arg
+            masked.append("$out.d")
+        else:
+            masked.append(arg)
+    return output, depfile, masked
+
+
+def relative_to_root(arg: str) -> str:
+    """
+    Strip the checkout's location from the paths in an argument.
+    """
+    return arg.replace(ROOT.as_posix() + "/", "").replace(str(ROOT) + os.sep, "")
+
+
+def compute_key(compiler: Path, args: List[str], deps: List[Path]) -> str:
+    """
+    Hash the compiler, the masked command line and every input the command pulls in.
+    The compiler's path is left out, its contents are what matter.
+    """
+    h = hashlib.sha1(CACHE_VERSION.encode())
+
+    h.update(b"compiler\0")
+    hash_file(h, compiler)
+
+    h.update(b"args\0")
+    h.update("\0".join(relative_to_root(arg) for arg in args[1:]).encode())
+
+    for path in deps:
+        h.update(b"\0file\0" + relative_to_root(path.as_posix()).encode() + b"\0")
+        hash_file(h, path)
+
+    return h.hexdigest()
+
+
+def entry_path(cache_dir: Path, key: str) -> Path:
+    return cache_dir / key[:2] / (key[2:] + ".o")
+
+#MARK: Eviction
+def evict(cache_dir: Path, max_size: int) -> None:
+    """
+    Delete least recently used objects until the cache is below 90% of max_size.
+    """
+    entries = []
+    for path in cache_dir.glob("??/*.o"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    entries.sort()
+    size = sum(e[1] for e in entries)
+    target = max_size * 9 // 10
+    for _, entry_size, path in entries:
+        if size <= target:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        size -= entry_size
+
+    with locked_stats(cache_dir) as stats:
+        stats["size"] = size
+
+#MARK: Wrapper
+def resolve_compiler(compiler: Path) -> Path:
+    """
+    Find the compiler binary: as given, with the .exe Wine adds when it runs it, or on PATH.
+    """
+    for candidate in (compiler, compiler.with_name(compiler.name + ".exe")):
+        if candidate.is_file():
+            return candidate
+    return Path(shutil.which(str(compiler)) or compiler)
+
+
+def run_cached(compiler: Path, command: List[str]) -> int:
+    """
+    Run a compile command through the cache.
+    """
+    # Only the part of the command from the compiler onwards affects the object, which keeps
+    # the key stable whether or not the compile server client sits in front of it
+    compiler_args = command
+    for idx, arg in enumerate(command):
+        if Path(arg).name in (compiler.name, compiler.name.removesuffix(".exe")):
+            compiler_args = command[idx:]
+            break
+
+    output, depfile, masked = split_output(compiler_args)
+    sources = [Path(a) for a in masked if Path(a).suffix in depscan.C_SUFFIXES | depscan.ASM_SUFFIXES]
+    if output is None or not sources or not compiler.is_file():
+        count(CACHE_DIR, "uncacheable")
+        return subprocess.run(command).returncode
+
+    deps = depscan.scan(sources, depscan.parse_include_dirs(masked))
+    key = compute_key(compiler, masked, deps)
+
+    # A hit skips the assembler, so write the depfile it would have written
+    hit_path = None
+    local = entry_path(CACHE_DIR, key)
+    if local.is_file():
+        hit_path = local
+        os.utime(local)
+        count(CACHE_DIR, "hits")
+    elif SHARED_DIR and entry_path(Path(SHARED_DIR), key).is_file():
+        hit_path = entry_path(Path(SHARED_DIR), key)
+        count(CACHE_DIR, "shared_hits")
+
+    if hit_path is not None:
+        shutil.copyfile(hit_path, output)
+        if depfile is not None:
+            depscan.write_depfile(Path(depfile), output, deps)
+        return 0
+
+    returncode = subprocess.run(command).returncode
+    if returncode != 0:
+        return returncode
+
+    local.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = local.with_suffix(f".{os.getpid()}.tmp")
+    shutil.copyfile(output, tmp_path)
+    os.replace(tmp_path, local)
+
+    size = count(CACHE_DIR, "misses", local.stat().st_size)
+    if size > MAX_SIZE:
+        evict(CACHE_DIR, MAX_SIZE)
+
+    return 0
+
+#MARK: Main
+def print_stats() -> None:
+    """
+    Print the hit/miss statistics.
+    """
+    with locked_stats(CACHE_DIR) as stats:
+        lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+        ratio = (stats["hits"] + stats["shared_hits"]) / lookups * 100 if lookups else 0.0
+        print(f"cache directory  {CACHE_DIR}")
+        print(f"shared directory {SHARED_DIR or '-'}")
+        print(f"hits             {stats['hits']}")
+        print(f"shared hits      {stats['shared_hits']}")
+        print(f"misses           {stats['misses']}")
+        print(f"uncacheable      {stats['uncacheable']}")
+        print(f"hit ratio        {ratio:.1f}%")
+        print(f"size             {stats['size'] / 1024 ** 2:.1f} MiB / {MAX_SIZE / 1024 ** 2:.1f} MiB")
+
+
+def main():
+    """
+    Main function, parses arguments and runs the wrapped command or a maintenance action.
+    """
+    argv = sys.argv[1:]
+    command: List[str] = []
+    if "--" in argv:
+        split_at = argv.index("--")
+        argv, command = argv[:split_at], argv[split_at + 1:]
+
+    parser = argparse.ArgumentParser(description="Object cache for the cc and as rules")
+    parser.add_argument("--compiler", help="Compiler binary the wrapped command runs", type=Path)
+    parser.add_argument("-s", "--stats", help="Show cache statistics", action="store_true")
+    parser.add_argument("-z", "--zero-stats", help="Reset cache statistics", action="store_true")
+    parser.add_argument("-C", "--clear", help="Delete every cached object", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.clear:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    if args.zero_stats:
+        with locked_stats(CACHE_DIR) as stats:
+            stats.update({"hits": 0, "shared_hits": 0, "misses": 0, "uncacheable": 0})
+    if args.stats:
+        print_stats()
+
+    if command:
+        if args.compiler is None:
+            parser.error("--compiler is required when wrapping a command")
+        sys.exit(run_cached(resolve_compiler(args.compiler), command))
+
+if __name__ == "__main__":
+    main()
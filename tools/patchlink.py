@@ -0,0 +1,295 @@
+"""
+Patch link for the inner decomp loop. After a full link, the layout of every object's sections
+in the output image is recorded from the linker map. Later links copy that image and overwrite
+only the sections of objects that changed, applying their relocations against the recorded
+symbol addresses. Anything that would move code or data around (a section changing size, a
+symbol changing address, an unknown relocation) falls back to the full ld + objcopy link.
+A patch link leaves the map and ELF of the last full link in place and only touches them.
+"""
+#! /usr/bin/env python3
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import elffile
+import mapfile
+
+#MARK: Constants
+STATE_VERSION = 1
+
+
+class FullLinkRequired(Exception):
+    """
+    Raised when a changed object can't be patched in place.
+    """
+
+#MARK: State
+def file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def object_fingerprint(path: Path) -> Dict:
+    st = path.stat()
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def record(state_path: Path, map_path: Path, elf_path: Path, image_path: Path, script_path: Path) -> None:
+    """
+    Record the layout of a full link and keep a copy of its image as the base for patching.
+    The objects are taken from the map, i.e. exactly what the linker script pulled in.
+    """
+    with elffile.open_mmap(elf_path) as data:
+        sections = elffile.read_sections(data)
+        symtab = elffile.find_section(sections, ".symtab", elffile.SHT_SYMTAB)
+        symbols = {}
+        if symtab is not None:
+            for sym in elffile.iter_symbols(data, sections, symtab):
+                if sym.bind != elffile.STB_LOCAL and sym.shndx != elffile.SHN_UNDEF and sym.name:
+                    symbols[sym.name] = sym.value
+
+    layout = mapfile.object_sections(map_path, include_noload=True)
+    base_path = image_path.with_name(image_path.name + ".base")
+    shutil.copyfile(image_path, base_path)
+
+    state = {
+        "version": STATE_VERSION,
+        "base": str(base_path),
+        "script": file_sha1(script_path),
+        "symbols": symbols,
+        "objects": {},
+    }
+    for obj, placed in layout.items():
+        fingerprint = object_fingerprint(Path(obj))
+        fingerprint["sha1"] = file_sha1(Path(obj))
+        fingerprint["sections"] = [[s.name, s.vma, s.size, s.offset] for s in placed]
+        state["objects"][obj] = fingerprint
+
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def changed_objects(state: Dict) -> List[Path]:
+    """
+    Return the objects whose contents differ from the recorded full link.
+    """
+    changed = []
+    for obj, recorded in state["objects"].items():
+        obj = Path(obj)
+        try:
+            fingerprint = object_fingerprint(obj)
+        except OSError:
+            raise FullLinkRequired(f"{obj} is missing")
+        if fingerprint["mtime_ns"] == recorded["mtime_ns"] and fingerprint["size"] == recorded["size"]:
+            continue
+        if file_sha1(obj) != recorded["sha1"]:
+            changed.append(obj)
+    return changed
+
+#MARK: Relocation
+def sign_extend_16(value: int) -> int:
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def relocate(contents: bytearray, section_vma: int, relocations, resolve, gp: int, gp0: int = 0) -> None:
+    """
+    Apply MIPS REL relocations to a section's contents in place.
+    resolve(symbol_index) returns the symbol's address and whether it is local to the object;
+    gp0 is the object's own gp value, which local GP-relative references are relative to.
+    """
+    pending_hi: List[Tuple[int, int]] = []
+
+    def read(offset: int) -> int:
+        return int.from_bytes(contents[offset:offset + 4], "little")
+
+    def write(offset: int, value: int) -> None:
+        contents[offset:offset + 4] = (value & 0xFFFFFFFF).to_bytes(4, "little")
+
+    for reloc in relocations:
+        if reloc.type == elffile.R_MIPS_NONE:
+            continue
+
+        insn = read(reloc.offset)
+        address, local = resolve(reloc.symbol)
+        place = section_vma + reloc.offset
+
+        if reloc.type == elffile.R_MIPS_32:
+            write(reloc.offset, insn + address)
+        elif reloc.type == elffile.R_MIPS_26:
+            target = ((insn & 0x3FFFFFF) << 2 | (place + 4) & 0xF0000000) + address
+            write(reloc.offset, (insn & ~0x3FFFFFF) | ((target >> 2) & 0x3FFFFFF))
+        elif reloc.type == elffile.R_MIPS_HI16:
+            pending_hi.append((reloc.offset, reloc.symbol))
+        elif reloc.type == elffile.R_MIPS_LO16:
+            lo = sign_extend_16(insn & 0xFFFF)
+            for hi_offset, hi_symbol in pending_hi:
+                if hi_symbol != reloc.symbol:
+                    raise FullLinkRequired("unpaired R_MIPS_HI16")
+                hi_insn = read(hi_offset)
+                value = ((hi_insn & 0xFFFF) << 16) + lo + address
+                write(hi_offset, (hi_insn & ~0xFFFF) | (((value + 0x8000) >> 16) & 0xFFFF))
+            pending_hi.clear()
+            write(reloc.offset, (insn & ~0xFFFF) | ((lo + address) & 0xFFFF))
+        elif reloc.type in (elffile.R_MIPS_GPREL16, elffile.R_MIPS_LITERAL):
+            value = sign_extend_16(insn & 0xFFFF) + address - gp
+            if local:
+                value += gp0
+            if not -0x8000 <= value < 0x8000:
+                raise FullLinkRequired("GP-relative relocation out of range")
+            write(reloc.offset, (insn & ~0xFFFF) | (value & 0xFFFF))
+        elif reloc.type == elffile.R_MIPS_PC16:
+            value = (sign_extend_16(insn & 0xFFFF) << 2) + address - place
+            write(reloc.offset, (insn & ~0xFFFF) | ((value >> 2) & 0xFFFF))
+        else:
+            raise FullLinkRequired(f"unsupported relocation type {reloc.type}")
+
+    if pending_hi:
+        raise FullLinkRequired("R_MIPS_HI16 without a matching R_MIPS_LO16")
+
+
+def patch_object(obj: Path, recorded: Dict, symbols: Dict[str, int]) -> List[Tuple[int, bytes]]:
+    """
+    Return (image offset, bytes) patches for one changed object.
+    """
+    data = obj.read_bytes()
+    sections = elffile.read_sections(data)
+
+    # Match the object's sections to the recorded placements, in order
+    placements: Dict[int, Tuple[int, int]] = {}
+    remaining = [s for s in recorded["sections"] if s[0] not in ("COMMON", ".scommon")]
+    for section in sections:
+        if section.type not in (elffile.SHT_PROGBITS, elffile.SHT_NOBITS) or section.size == 0:
+            continue
+        for idx, (name, vma, size, offset) in enumerate(remaining):
+            if name == section.name:
+                if size != section.size:
+                    raise FullLinkRequired(f"{obj}: {name} changed size")
+                placements[section.index] = (vma, offset)
+                del remaining[idx]
+                break
+    if remaining:
+        raise FullLinkRequired(f"{obj}: sections changed")
+
+    symtab = elffile.find_section(sections, ".symtab", elffile.SHT_SYMTAB)
+    object_symbols = list(elffile.iter_symbols(data, sections, symtab)) if symtab else []
+
+    def address_of(sym: elffile.Symbol) -> Optional[int]:
+        if sym.shndx == elffile.SHN_ABS:
+            return sym.value
+        if sym.shndx in placements:
+            return placements[sym.shndx][0] + sym.value
+        return None
+
+    # Every global the object defines must stay where the rest of the image expects it
+    for sym in object_symbols:
+        if sym.bind == elffile.STB_LOCAL or sym.shndx == elffile.SHN_UNDEF:
+            continue
+        address = address_of(sym)
+        if address is not None and symbols.get(sym.name) != address:
+            raise FullLinkRequired(f"{obj}: {sym.name} moved")
+
+    def resolve(index: int) -> Tuple[int, bool]:
+        sym = object_symbols[index]
+        address = address_of(sym)
+        if address is not None:
+            return address, True
+        if sym.name in symbols:
+            return symbols[sym.name], False
+        raise FullLinkRequired(f"{obj}: can't resolve {sym.name or index}")
+
+    gp = symbols.get("_gp", 0)
+    gp0 = 0
+    reginfo = elffile.find_section(sections, ".reginfo")
+    if reginfo is not None and reginfo.size >= 24:
+        gp0 = int.from_bytes(elffile.section_data(data, reginfo)[20:24], "little")
+    rel_sections = {s.info: s for s in sections if s.type == elffile.SHT_REL}
+    if any(s.type == elffile.SHT_RELA for s in sections):
+        raise FullLinkRequired(f"{obj}: RELA relocations")
+
+    patches = []
+    for index, (vma, offset) in placements.items():
+        if sections[index].type == elffile.SHT_NOBITS:
+            continue
+        contents = bytearray(elffile.section_data(data, sections[index]))
+        if index in rel_sections:
+            relocate(contents, vma, elffile.iter_relocations(data, rel_sections[index]), resolve, gp, gp0)
+        patches.append((offset, bytes(contents)))
+    return patches
+
+
+def patch(state_path: Path, image_path: Path, script_path: Path) -> int:
+    """
+    Rebuild the image from the recorded base by patching in the changed objects.
+    Returns the number of objects patched; raises FullLinkRequired if that isn't possible.
+    """
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        raise FullLinkRequired("no recorded full link")
+    if state.get("version") != STATE_VERSION or not Path(state["base"]).exists():
+        raise FullLinkRequired("no recorded full link")
+    if file_sha1(script_path) != state["script"]:
+        raise FullLinkRequired("the linker script changed")
+
+    changed = changed_objects(state)
+    patches = []
+    for obj in changed:
+        patches += patch_object(obj, state["objects"][str(obj)], state["symbols"])
+
+    tmp_path = image_path.with_name(image_path.name + ".tmp")
+    shutil.copyfile(state["base"], tmp_path)
+    if patches:
+        with open(tmp_path, "r+b") as f:
+            with mmap.mmap(f.fileno(), 0) as image:
+                for offset, contents in patches:
+                    image[offset:offset + len(contents)] = contents
+    os.replace(tmp_path, image_path)
+    return len(changed)
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments and patch links, falling back to a full link.
+    """
+    parser = argparse.ArgumentParser(description="Patch changed objects into the last linked image")
+    parser.add_argument("--state", help="Recorded layout of the last full link", type=Path, required=True)
+    parser.add_argument("--map", help="Map file the full link writes", type=Path, required=True)
+    parser.add_argument("--elf", help="ELF the full link writes", type=Path, required=True)
+    parser.add_argument("--script", help="Linker script", type=Path, required=True)
+    parser.add_argument("--out", help="Raw image to produce", type=Path, required=True)
+    parser.add_argument("--ld", help="Full link command", required=True)
+    parser.add_argument("--objcopy", help="Command converting the ELF to the raw image", required=True)
+    args = parser.parse_args()
+
+    try:
+        patched = patch(args.state, args.out, args.script)
+        # The map and ELF are implicit outputs of the edge; the layout is unchanged, so touch
+        # them rather than relink, or ninja would consider the edge dirty on every run
+        for path in (args.map, args.elf):
+            os.utime(path)
+        print(f"patch link: {patched} object(s) patched")
+        return
+    except FullLinkRequired as e:
+        print(f"patch link: full link required ({e})")
+
+    for command in (args.ld, args.objcopy):
+        returncode = subprocess.run(shlex.split(command)).returncode
+        if returncode != 0:
+            sys.exit(returncode)
+
+    record(args.state, args.map, args.elf, args.out, args.script)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Batch driver for decomp-permuter. Picks nonmatching functions that have a C draft next to their
+INCLUDE_ASM, closest to matching first (from an objdiff report) or smallest first, imports each
+into its own permuter workspace under build/permuter and runs the permuters concurrently within
+one shared time budget, then collects the improvements they found into a summary.
+
+Every workspace compiles through `permute.py cc`, which caches candidate objects on the contents
+of the candidate source and the command line, so a candidate seen before is never recompiled;
+with --compile-server the misses go through tools/mwcc_server.py and its persistent wineserver.
+
+Environment:
+    PERMUTER_DIR  decomp-permuter checkout (default: tools/decomp-permuter)
+"""
+#! /usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import demangle
+import depscan
+import objcache
+
+#MARK: Constants
+ROOT = Path(__file__).parent.parent.resolve()
+TOOLS_DIR = ROOT / "tools"
+PERMUTER_DIR = Path(os.environ.get("PERMUTER_DIR", TOOLS_DIR / "decomp-permuter"))
+WORK_DIR = ROOT / "build" / "permuter"
+CACHE_DIR = WORK_DIR / "cache"
+SUMMARY_PATH = WORK_DIR / "summary.json"
+NONMATCHINGS_DIR = Path("asm/nonmatchings")
+
+DEFAULT_COUNT = 8
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_BUDGET = 3600
+MIN_SLICE = 60  # Seconds; less and a permuter barely gets past its base compile
+STOP_GRACE = 10  # Seconds a permuter gets to finish writing its output after SIGINT
+
+BASE_SCORE = re.compile(r"base score = (\d+)")
+OUTPUT_DIR = re.compile(r"output-(\d+)-\d+")
+INSTRUCTION_LINE = re.compile(r"^\s*/\* [0-9A-F]+ ", re.MULTILINE)
+
+#MARK: Selection
+class Function(NamedTuple):
+    name: str
+    unit: str
+    asm: Path
+    src: Path
+    size: int
+    match_percent: Optional[float]
+
+
+def load_scores(path: Path) -> Dict[str, float]:
+    """
+    Load per-function match percentages from an objdiff report, a tools/matchscore.py ranking
+    or a plain {function: percent} map.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if "functions" in report:
+        return {function["name"]: float(function["match_percent"]) for function in report["functions"]}
+    if "units" not in report:
+        return {name: float(percent) for name, percent in report.items()}
+
+    scores = {}
+    for unit in report["units"]:
+        for function in unit.get("functions") or []:
+            if function.get("fuzzy_match_percent") is not None:
+                scores[function["name"]] = float(function["fuzzy_match_percent"])
+    return scores
+
+
+def has_draft(source: str, name: str) -> bool:
+    """
+    Check whether a source defines the function in C, e.g. under #ifdef NON_MATCHING next to its INCLUDE_ASM.
+    """
+    demangled = demangle.demangle(name)
+    qualified = demangled.split("(")[0] if demangled else name
+    return re.search(re.escape(qualified) + r"\s*\([^;{}]*\)\s*(const\s*)?\{", source) is not None
+
+
+def find_functions(scores: Dict[str, float]) -> List[Function]:
+    """
+    Return the nonmatching functions with a C draft to permute, best candidates first.
+    """
+    src_by_rel = {}
+    for path in sorted(Path("src").rglob("*")):
+        if path.suffix in (".c", ".cpp"):
+            src_by_rel.setdefault(path.relative_to("src").with_suffix("").as_posix(), path)
+
+    sources: Dict[Path, str] = {}
+    functions = []
+    for asm in sorted(NONMATCHINGS_DIR.rglob("*.s")):
+        unit = asm.parent.relative_to(NONMATCHINGS_DIR).as_posix()
+        src = src_by_rel.get(unit)
+        if src is None:
+            continue
+        if src not in sources:
+            sources[src] = src.read_text(encoding="utf-8", errors="replace")
+        if not has_draft(sources[src], asm.stem):
+            continue
+        size = len(INSTRUCTION_LINE.findall(asm.read_text(encoding="utf-8", errors="replace")))
+        functions.append(Function(asm.stem, unit, asm, src, size, scores.get(asm.stem)))
+
+    # Closest to matching first, then the smallest, which the permuter explores fastest
+    functions.sort(key=lambda f: (-(f.match_percent or 0.0), f.size, f.name))
+    return functions
+
+#MARK: Workspaces
+def compile_script(compile_server: bool) -> str:
+    """
+    The compile.sh every workspace runs candidates through, going via the candidate cache.
+    """
+    # configure pulls in splat, which the per-candidate cc path below shouldn't pay for
+    sys.path.insert(0, str(ROOT))
+    import configure
+
+    command = configure.COMPILE_CMD
+    if compile_server:
+        command = configure.COMPILE_SERVER_CMD
+    command = command.replace("$in", '"$INPUT"')
+    return f"""#!/usr/bin/env bash
+INPUT="$(realpath "$1")"
+OUTPUT="$(realpath "$3")"
+cd "{ROOT}"
+{sys.executable} {TOOLS_DIR}/permute.py cc -- {command} -D__GNUC__ -o "$OUTPUT"
+"""
+
+
+def prepare(function: Function, script: str, fresh: bool) -> Path:
+    """
+    Import a function with the permuter's import.py, move the workspace under build/permuter and
+    point its compile.sh at the candidate cache. An existing workspace is kept, with its outputs.
+    """
+    workspace = WORK_DIR / function.name
+    if workspace.exists() and fresh:
+        shutil.rmtree(workspace)
+
+    if not (workspace / "base.c").exists():
+        # import.py always creates its workspace in ./nonmatchings
+        imported_dir = ROOT / "nonmatchings"
+        before = set(imported_dir.iterdir()) if imported_dir.exists() else set()
+        subprocess.run(
+            [sys.executable, str(PERMUTER_DIR / "import.py"), str(function.src), str(function.asm)],
+            cwd=ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        created = sorted(set(imported_dir.iterdir()) - before)
+        if len(created) != 1:
+            raise RuntimeError(f"import.py created {len(created)} workspaces for {function.name}")
+        workspace.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(created[0]), workspace)
+        if not any(imported_dir.iterdir()):
+            imported_dir.rmdir()
+
+    compile_sh = workspace / "compile.sh"
+    compile_sh.write_text(script, encoding="utf-8")
+    compile_sh.chmod(0o755)
+    return workspace
+
+#MARK: Run
+def best_output(workspace: Path) -> Optional[Path]:
+    """
+    Return the permuter output directory with the lowest score, if any.
+    """
+    outputs = [(int(m.group(1)), p) for p in workspace.iterdir() if (m := OUTPUT_DIR.fullmatch(p.name))]
+    return min(outputs)[1] if outputs else None
+
+
+def permute(function: Function, workspace: Path, seconds: float, deadline: float, permuter_args: List[str]) -> Dict:
+    """
+    Run the permuter on one workspace until it matches, its slice runs out or the budget does.
+    """
+    result = {
+        "function": function.name,
+        "unit": function.unit,
+        "size": function.size,
+        "match_percent": function.match_percent,
+        "workspace": os.path.relpath(workspace, ROOT),
+    }
+
+    timeout = min(seconds, deadline - time.monotonic())
+    if timeout <= 0:
+        result["status"] = "skipped"
+        return result
+
+    start = time.monotonic()
+    with open(workspace / "permuter.log", "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(
+            [sys.executable, str(PERMUTER_DIR / "permuter.py"), str(workspace), "--stop-on-zero", "-j1"] + permuter_args,
+            cwd=ROOT,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            proc.wait(timeout=timeout)
+            result["status"] = "matched" if proc.returncode == 0 else "failed"
+        except subprocess.TimeoutExpired:
+            # The permuter stops cleanly on Ctrl-C
+            proc.send_signal(signal.SIGINT if sys.platform != "win32" else signal.SIGTERM)
+            try:
+                proc.wait(timeout=STOP_GRACE)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            result["status"] = "timeout"
+    result["seconds"] = round(time.monotonic() - start, 1)
+
+    base = BASE_SCORE.search((workspace / "permuter.log").read_text(encoding="utf-8", errors="replace"))
+    result["base_score"] = int(base.group(1)) if base else None
+
+    output = best_output(workspace)
+    result["best_score"] = int(OUTPUT_DIR.fullmatch(output.name).group(1)) if output else None
+    result["output"] = os.path.relpath(output, ROOT) if output else None
+    if result["best_score"] == 0:
+        result["status"] = "matched"
+    return result
+
+#MARK: Candidate cache
+def cached_compile(command: List[str]) -> int:
+    """
+    Compile a permuter candidate, reusing the object (or the error) of an identical earlier candidate.
+    The candidate's path is masked out of the key, as the permuter writes each one to a new temp file.
+    """
+    output, _, masked = objcache.split_output(command)
+    sources = [idx for idx, arg in enumerate(masked) if Path(arg).suffix in depscan.C_SUFFIXES]
+    if output is None or not sources:
+        return subprocess.run(command).returncode
+
+    h = hashlib.sha1()
+    for idx in sources:
+        objcache.hash_file(h, Path(masked[idx]))
+        masked[idx] = "$in"
+    h.update(b"\0args\0" + "\0".join(masked).encode())
+    key = h.hexdigest()
+
+    obj = CACHE_DIR / key[:2] / (key[2:] + ".o")
+    failed = obj.with_suffix(".err")
+    if obj.is_file():
+        shutil.copyfile(obj, output)
+        return 0
+    if failed.is_file():
+        sys.stderr.buffer.write(failed.read_bytes())
+        return 1
+
+    proc = subprocess.run(command, capture_output=True)
+    sys.stdout.buffer.write(proc.stdout)
+    sys.stderr.buffer.write(proc.stderr)
+
+    obj.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = obj.with_suffix(f".{os.getpid()}.tmp")
+    if proc.returncode != 0:
+        tmp_path.write_bytes(proc.stdout + proc.stderr)
+        os.replace(tmp_path, failed)
+        return proc.returncode
+    shutil.copyfile(output, tmp_path)
+    os.replace(tmp_path, obj)
+    return 0
+
+#MARK: Main
+def run(args) -> None:
+    """
+    Select the functions, prepare their workspaces, permute them and write the summary.
+    """
+    if not (PERMUTER_DIR / "permuter.py").exists():
+        print(f"decomp-permuter not found in {PERMUTER_DIR}, clone it there or set PERMUTER_DIR")
+        sys.exit(1)
+
+    scores = load_scores(args.report) if args.report else {}
+    functions = find_functions(scores)
+    if args.function:
+        functions = [f for f in functions if f.name in args.function]
+    functions = functions[:args.count]
+    if not functions:
+        print("No nonmatching functions with a C draft to permute")
+        return
+
+    script = compile_script(args.compile_server)
+    workspaces = [prepare(f, script, args.fresh) for f in functions]
+
+    # Every function gets an equal slice of the budget; one that matches early frees its worker
+    workers = min(args.workers, len(functions))
+    seconds = max(args.budget * workers / len(functions), MIN_SLICE)
+    deadline = time.monotonic() + args.budget
+    print(f"Permuting {len(functions)} functions on {workers} workers, {seconds:.0f} s each, {args.budget} s in total")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda fw: permute(fw[0], fw[1], seconds, deadline, args.permuter_args), zip(functions, workspaces)))
+
+    SUMMARY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(SUMMARY_PATH, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for result in sorted(results, key=lambda r: (r["status"] != "matched", r.get("best_score") is None, r.get("best_score") or 0)):
+        base = result.get("base_score")
+        best = result.get("best_score")
+        change = f"{base} -> {best}" if base is not None and best is not None else f"{base if base is not None else '?'}"
+        print(f"  {result['status']:<8} {change:<16} {result['function']} ({result['unit']}) {result.get('output') or ''}")
+    print(f"Wrote {os.path.relpath(SUMMARY_PATH, ROOT)}")
+
+
+def main():
+    """
+    Main function, parses arguments and runs the batch or compiles one candidate.
+    """
+    parser = argparse.ArgumentParser(description="Run decomp-permuter over many nonmatching functions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Permute a batch of nonmatching functions")
+    run_parser.add_argument("-n", "--count", help="Number of functions to permute", type=int, default=DEFAULT_COUNT)
+    run_parser.add_argument("-j", "--workers", help="Number of permuters to run at once", type=int, default=DEFAULT_WORKERS)
+    run_parser.add_argument("-t", "--budget", help="Total time budget in seconds", type=int, default=DEFAULT_BUDGET)
+    run_parser.add_argument("--report", help="objdiff report, tools/matchscore.py ranking or {function: percent} JSON to prioritize by match", type=Path)
+    run_parser.add_argument("-f", "--function", help="Only permute this function (repeatable)", action="append")
+    run_parser.add_argument("--compile-server", help="Compile candidate misses through tools/mwcc_server.py", action="store_true")
+    run_parser.add_argument("--fresh", help="Reimport workspaces instead of continuing in existing ones", action="store_true")
+    run_parser.add_argument("permuter_args", help="Extra arguments for permuter.py, after --", nargs=argparse.REMAINDER)
+
+    cc_parser = subparsers.add_parser("cc", help="Compile one candidate through the candidate cache")
+    cc_parser.add_argument("args", nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if args.permuter_args and args.permuter_args[0] == "--":
+            args.permuter_args = args.permuter_args[1:]
+        os.chdir(ROOT)
+        run(args)
+    elif args.command == "cc":
+        compiler_args = args.args
+        if compiler_args and compiler_args[0] == "--":
+            compiler_args = compiler_args[1:]
+        sys.exit(cached_compile(compiler_args))
+
+if __name__ == "__main__":
+    main()
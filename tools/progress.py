@@ -0,0 +1,216 @@
+"""
+Incremental progress report. Every objdiff unit's result is cached on the sha1s of its target and
+base objects (checked by size and mtime first). Only units whose objects changed are diffed again,
+by running `objdiff-cli report generate` on an objdiff.json reduced to just those units; the
+cached and fresh results are then merged into the full report and the per-category progress
+figures.
+
+The report follows the layout of `objdiff-cli report generate` (measures, categories, units with
+functions), so tools/permute.py --report reads it too.
+"""
+#! /usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+#MARK: Constants
+CACHE_VERSION = "2"
+ROOT = Path(__file__).parent.parent.resolve()
+OBJDIFF_CLI = ROOT / "tools" / "objdiff" / "objdiff-cli"
+OBJDIFF_PATH = Path("objdiff.json")
+REPORT_PATH = Path("build/progress/report.json")
+CACHE_PATH = Path("build/progress/cache.json")
+WORK_DIR = Path("build/progress/changed")
+
+MEASURES = ("total_code", "matched_code", "total_data", "matched_data", "total_functions", "matched_functions", "total_units", "complete_units")
+
+#MARK: Fingerprints
+def fingerprint(path: Optional[Path], cached: Dict) -> Optional[Dict]:
+    """
+    Return {size, mtime_ns, sha1} for a file, reusing the cached sha1 while size and mtime are unchanged.
+    """
+    if path is None:
+        return None
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    if cached and cached.get("size") == st.st_size and cached.get("mtime_ns") == st.st_mtime_ns:
+        return cached
+    with open(path, "rb") as f:
+        sha1 = hashlib.sha1(f.read()).hexdigest()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": sha1}
+
+#MARK: Diff
+def unit_result(unit: Dict) -> Dict:
+    """
+    Reduce a unit of objdiff's report to its measures and per-function results. objdiff writes
+    64-bit counts as strings and leaves out zero values.
+    """
+    reported = unit.get("measures", {})
+    measures = {key: int(reported.get(key, 0)) for key in MEASURES}
+    measures["total_units"] = 1
+    measures["fuzzy_match_percent"] = float(reported.get("fuzzy_match_percent", 0.0))
+    functions = [
+        {"name": f["name"], "size": int(f.get("size", 0)), "fuzzy_match_percent": float(f.get("fuzzy_match_percent", 0.0))}
+        for f in unit.get("functions", [])
+    ]
+    return {"name": unit["name"], "measures": measures, "functions": functions}
+
+
+def diff_units(objdiff_cli: Path, config: Dict, config_dir: Path, units: List[Dict]) -> Dict[str, Dict]:
+    """
+    Diff the given units with objdiff, through a copy of objdiff.json reduced to them.
+    Returns their results by unit name.
+    """
+    if not units:
+        return {}
+
+    reduced = []
+    for unit in units:
+        unit = dict(unit)
+        # The reduced config lives elsewhere, so its paths have to be absolute
+        for key in ("target_path", "base_path"):
+            if key in unit:
+                unit[key] = (config_dir / unit[key]).resolve().as_posix()
+        reduced.append(unit)
+
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    with open(WORK_DIR / "objdiff.json", "w", encoding="utf-8") as f:
+        json.dump({**config, "units": reduced}, f, indent=2)
+
+    report_path = WORK_DIR / "report.json"
+    subprocess.run([str(objdiff_cli), "report", "generate", "-p", str(WORK_DIR), "-o", str(report_path), "-f", "json"], check=True)
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return {unit["name"]: unit_result(unit) for unit in report.get("units", [])}
+
+#MARK: Report
+def summarize(units: List[Dict]) -> Dict:
+    """
+    Sum unit measures, adding the percentages.
+    """
+    measures = dict.fromkeys(MEASURES, 0)
+    fuzzy = 0.0
+    for unit in units:
+        for key in MEASURES:
+            measures[key] += unit["measures"][key]
+        fuzzy += unit["measures"]["fuzzy_match_percent"] * unit["measures"]["total_code"]
+    for matched, total in (("matched_code", "total_code"), ("matched_data", "total_data"), ("matched_functions", "total_functions"), ("complete_units", "total_units")):
+        measures[f"{matched}_percent"] = measures[matched] / measures[total] * 100 if measures[total] else 100.0
+    measures["fuzzy_match_percent"] = fuzzy / measures["total_code"] if measures["total_code"] else 100.0
+    return measures
+
+
+def generate(objdiff_cli: Path, objdiff_path: Path, cache_path: Path) -> Tuple[Dict, int]:
+    """
+    Build the full report, diffing only units whose objects changed. Returns it and the number of units diffed.
+    """
+    with open(objdiff_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    config_dir = objdiff_path.parent
+    categories = {c["id"]: c["name"] for c in config.get("progress_categories", [])}
+
+    cache: Dict = {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if cache.get("version") != CACHE_VERSION:
+        cache = {"version": CACHE_VERSION, "units": {}}
+
+    new_cache = {"version": CACHE_VERSION, "units": {}}
+    units = []
+    changed = []
+    for unit in config["units"]:
+        cached = cache["units"].get(unit["name"], {})
+        target = fingerprint(config_dir / unit["target_path"], cached.get("target"))
+        if target is None:
+            continue
+        base = fingerprint(config_dir / unit["base_path"], cached.get("base")) if "base_path" in unit else None
+
+        unchanged = cached.get("target", {}).get("sha1") == target["sha1"] and (cached.get("base") or {}).get("sha1") == (base or {}).get("sha1")
+        if cached.get("result") is None or not unchanged:
+            changed.append(unit)
+        units.append(unit)
+        new_cache["units"][unit["name"]] = {"target": target, "base": base, "result": cached.get("result")}
+
+    fresh = diff_units(objdiff_cli, config, config_dir, changed)
+    changed_names = {unit["name"] for unit in changed}
+
+    results = []
+    for unit in units:
+        entry = new_cache["units"][unit["name"]]
+        if unit["name"] in changed_names:
+            if unit["name"] not in fresh:
+                # objdiff left it out of the report, so there's nothing to cache for it
+                del new_cache["units"][unit["name"]]
+                continue
+            entry["result"] = fresh[unit["name"]]
+        result = entry["result"]
+        result["metadata"] = {"progress_categories": unit.get("metadata", {}).get("progress_categories", [])}
+        results.append(result)
+
+    report = {
+        "measures": summarize(results),
+        "categories": [
+            {"id": id, "name": name, "measures": summarize([r for r in results if id in r["metadata"]["progress_categories"]])}
+            for id, name in categories.items()
+        ],
+        "units": results,
+    }
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(new_cache, f)
+    os.replace(tmp_path, cache_path)
+    return report, len(changed)
+
+
+def format_measures(name: str, measures: Dict) -> str:
+    return (
+        f"{name:<10} code {measures['matched_code_percent']:6.2f}% ({measures['matched_code']}/{measures['total_code']}) "
+        f"data {measures['matched_data_percent']:6.2f}% "
+        f"functions {measures['matched_functions']}/{measures['total_functions']} "
+        f"fuzzy {measures['fuzzy_match_percent']:6.2f}%"
+    )
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments, updates the report and prints the progress.
+    """
+    parser = argparse.ArgumentParser(description="Incrementally regenerate the progress report from objdiff.json")
+    parser.add_argument("--objdiff", help="objdiff.json listing the target and base objects", type=Path, default=OBJDIFF_PATH)
+    parser.add_argument("-o", "--output", help="Report to write", type=Path, default=REPORT_PATH)
+    parser.add_argument("--cache", help="Per-unit result cache", type=Path, default=CACHE_PATH)
+    parser.add_argument("--objdiff-cli", help="objdiff-cli binary the changed units are diffed with", type=Path, default=OBJDIFF_CLI)
+    parser.add_argument("-q", "--quiet", help="Only write the report", action="store_true")
+    args = parser.parse_args()
+
+    if not args.objdiff_cli.is_file():
+        print(f"{args.objdiff_cli} not found")
+        sys.exit(1)
+
+    report, diffed = generate(args.objdiff_cli.resolve(), args.objdiff, args.cache)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if args.quiet:
+        return
+    print(f"{diffed} of {len(report['units'])} units diffed")
+    print(format_measures("All", report["measures"]))
+    for category in report["categories"]:
+        print(format_measures(category["name"], category["measures"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Workaround for the short loop bug: mwccps2's inline assembler pads short loops with nops that
+the original compiler didn't emit. For the affected functions, every branch instruction in the
+split asm is replaced by its raw opcode, which the assembler can't touch.
+
+Runs as a ninja edge per function: it reads the pristine split output and writes the patched
+file only when its contents change, so dependent objects rebuild exactly once. The sha1 of the
+patched file is recorded next to the pristine copy, which lets configure tell a freshly split
+file apart from one this tool wrote.
+"""
+#! /usr/bin/env python3
+import argparse
+import hashlib
+import re
+from pathlib import Path
+
+#MARK: Patterns
+# The branches mwccps2 pads loops around; tools/loopscan.py scans for the same set
+BRANCH_MNEMONICS = (
+    "bne", "bnel", "beq", "beql", "bnez", "bnezl", "beqz", "beqzl",
+    "bgez", "bgezl", "bgtz", "bgtzl", "blez", "blezl", "bltz", "bltzl", "b",
+)
+COMMENT_PART = r"\/\* (.+) ([0-9A-Z]{2})([0-9A-Z]{2})([0-9A-Z]{2})([0-9A-Z]{2}) \*\/"
+INSTRUCTION_PART = rf"(\b({'|'.join(BRANCH_MNEMONICS)})\b.*)"
+OPCODE_PATTERN = re.compile(f"{COMMENT_PART}  {INSTRUCTION_PART}")
+
+#MARK: Patch
+def patch(content: str) -> str:
+    """
+    Embed the opcode of every branch, swapping the byte order for the correct endianness.
+    """
+    return OPCODE_PATTERN.sub(r"/* \1 \2\3\4\5 */  .word      0x\5\4\3\2 /* \6 */", content)
+
+
+def content_sha1(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def run(src: Path, out: Path, hash_path: Path) -> bool:
+    """
+    Patch src into out, leaving out untouched if it already matches. Returns whether it wrote.
+    """
+    patched = patch(src.read_text(encoding="utf-8"))
+    sha1 = content_sha1(patched)
+    hash_path.write_text(sha1 + "\n", encoding="utf-8")
+
+    try:
+        if content_sha1(out.read_text(encoding="utf-8")) == sha1:
+            return False
+    except OSError:
+        pass
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(patched, encoding="utf-8")
+    return True
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments and patches one function's asm.
+    """
+    parser = argparse.ArgumentParser(description="Replace branch instructions with raw opcodes")
+    parser.add_argument("src", help="Pristine split asm", type=Path)
+    parser.add_argument("out", help="Patched asm to write", type=Path)
+    parser.add_argument("--hash", help="File to record the patched sha1 in", type=Path, required=True)
+    args = parser.parse_args()
+
+    run(args.src, args.out, args.hash)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Splice a byte range of the original binary into the built image. The sections after the
+loadable image (symtab, strtab, debug, line, ...) are never modified by decompilation, so
+instead of extracting them, assembling them with .incbin and pushing them through ld and
+objcopy, they are copied straight from the original at their offsets, with copy_file_range
+or sendfile where the OS has them.
+"""
+#! /usr/bin/env python3
+import argparse
+import os
+import shutil
+import sys
+from pathlib import Path
+
+#MARK: Copy
+def copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
+    """
+    Copy count bytes from offset in src to the same offset in dst, in the kernel if possible.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            while count > 0:
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+                if copied == 0:
+                    break
+                offset += copied
+                count -= copied
+            if count == 0:
+                return
+        except OSError:
+            # e.g. across filesystems on older kernels, finish with sendfile below
+            pass
+
+    if hasattr(os, "sendfile") and sys.platform != "win32":
+        try:
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            while count > 0:
+                sent = os.sendfile(dst_fd, src_fd, offset, count)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+            if count == 0:
+                return
+        except OSError:
+            pass
+
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    while count > 0:
+        chunk = os.read(src_fd, min(count, 1 << 20))
+        if not chunk:
+            break
+        os.write(dst_fd, chunk)
+        count -= len(chunk)
+
+    if count:
+        raise OSError(f"short read, {count} bytes left to copy")
+
+
+def splice(image: Path, target: Path, out: Path, start: int, end: int) -> None:
+    """
+    Write image followed by target[start:end] to out. The image must end at or before start;
+    any gap is zero-filled.
+    """
+    image_size = image.stat().st_size
+    if image_size > start:
+        raise ValueError(f"{image} is 0x{image_size:X} bytes, past the splice start 0x{start:X}")
+    if target.stat().st_size < end:
+        raise ValueError(f"{target} ends before the splice end 0x{end:X}")
+
+    tmp = out.with_name(out.name + ".tmp")
+    shutil.copyfile(image, tmp)
+    with open(target, "rb") as src, open(tmp, "r+b") as dst:
+        dst.truncate(start)
+        copy_range(src.fileno(), dst.fileno(), start, end - start)
+    os.replace(tmp, out)
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments and splices the range into the image.
+    """
+    parser = argparse.ArgumentParser(description="Append a byte range of the original binary to the built image")
+    parser.add_argument("image", help="Linked image, ending at or before --start", type=Path)
+    parser.add_argument("out", help="Image to write", type=Path)
+    parser.add_argument("--target", help="Original binary", type=Path, required=True)
+    parser.add_argument("--start", help="Start of the range", type=lambda x: int(x, 0), required=True)
+    parser.add_argument("--end", help="End of the range", type=lambda x: int(x, 0), required=True)
+    args = parser.parse_args()
+
+    splice(args.image, args.target, args.out, args.start, args.end)
+
+if __name__ == "__main__":
+    main()
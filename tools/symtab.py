@@ -0,0 +1,236 @@
+"""
+Extract the function and object symbols from the original binary's .symtab/.strtab into
+symbol_addrs.txt. The binary is memory-mapped and the tables are read entry by entry. The result
+is cached keyed on the binary's sha1, so repeated runs don't re-parse them.
+
+Hand-written entries in symbol_addrs.txt take precedence: the extracted symbols go in a marked
+block at the end of the file, which is the only part a refresh rewrites, and any hand-written
+entry that disagrees with the binary is reported as drift.
+"""
+#! /usr/bin/env python3
+import argparse
+import hashlib
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import demangle
+import elffile
+
+#MARK: Constants
+CACHE_VERSION = 1
+BEGIN_MARKER = "// BEGIN symbols extracted from the binary by tools/symtab.py, edits below are overwritten"
+END_MARKER = "// END symbols extracted from the binary"
+
+SYMBOL_LINE = re.compile(r"^\s*([A-Za-z_.$][\w.$]*)\s*=\s*(0x[0-9a-fA-F]+|\d+)\s*;\s*(?://(.*))?$")
+VALID_NAME = re.compile(r"^[A-Za-z_][\w$]*$")
+SHF_ALLOC = 0x2
+
+#MARK: Types
+class SymbolEntry(NamedTuple):
+    name: str
+    vram: int
+    size: int
+    type: Optional[str]
+    demangled: Optional[str] = None
+
+#MARK: Extraction
+def file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def extract_symbols(binary: Path) -> List[SymbolEntry]:
+    """
+    Read the sized function and object symbols of the binary, sorted by address.
+    Globals win over locals when names collide; later duplicates are dropped, since splat
+    needs unique names.
+    """
+    with elffile.open_mmap(binary) as data:
+        sections = elffile.read_sections(data)
+        symtab = elffile.find_section(sections, ".symtab", elffile.SHT_SYMTAB)
+        if symtab is None:
+            return []
+
+        found = []
+        for sym in elffile.iter_symbols(data, sections, symtab):
+            if sym.type not in (elffile.STT_FUNC, elffile.STT_OBJECT) or not VALID_NAME.match(sym.name):
+                continue
+            if sym.shndx == elffile.SHN_UNDEF or sym.shndx >= len(sections) or not sections[sym.shndx].flags & SHF_ALLOC:
+                continue
+            found.append(sym)
+
+    found.sort(key=lambda sym: (sym.bind == elffile.STB_LOCAL, sym.value))
+    names = set()
+    addresses = set()
+    symbols = []
+    for sym in found:
+        if sym.name in names or sym.value in addresses:
+            continue
+        names.add(sym.name)
+        addresses.add(sym.value)
+        sym_type = "func" if sym.type == elffile.STT_FUNC else None
+        symbols.append(SymbolEntry(sym.name, sym.value, sym.size, sym_type, demangle.demangle(sym.name)))
+
+    symbols.sort(key=lambda s: s.vram)
+    return symbols
+
+
+def load_symbols(binary: Path, cache_path: Path) -> List[SymbolEntry]:
+    """
+    Return the binary's symbols, from the cache if it was built from the same binary.
+    The sha1 is only recomputed when the binary's size or mtime changed.
+    """
+    st = binary.stat()
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    if cache.get("version") == CACHE_VERSION:
+        if cache.get("size") == st.st_size and cache.get("mtime_ns") == st.st_mtime_ns:
+            return [SymbolEntry(*s) for s in cache["symbols"]]
+        sha1 = file_sha1(binary)
+        if cache.get("sha1") == sha1:
+            cache.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            return [SymbolEntry(*s) for s in cache["symbols"]]
+    else:
+        sha1 = file_sha1(binary)
+
+    symbols = extract_symbols(binary)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": CACHE_VERSION,
+            "sha1": sha1,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "symbols": [list(s) for s in symbols],
+        }, f)
+    return symbols
+
+#MARK: symbol_addrs.txt
+def parse_attributes(comment: Optional[str]) -> Dict[str, str]:
+    attributes = {}
+    for token in (comment or "").split():
+        key, sep, value = token.partition(":")
+        if sep:
+            attributes[key] = value
+    return attributes
+
+
+def read_symbol_addrs(path: Path) -> Tuple[List[str], List[SymbolEntry]]:
+    """
+    Split symbol_addrs.txt into its hand-written lines and the symbols they define.
+    The extracted block, if any, is left out of both.
+    """
+    if not path.exists():
+        return [], []
+
+    lines = []
+    symbols = []
+    in_block = False
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line == BEGIN_MARKER:
+                in_block = True
+            elif line == END_MARKER:
+                in_block = False
+            elif not in_block:
+                lines.append(line)
+                m = SYMBOL_LINE.match(line)
+                if m is not None:
+                    attributes = parse_attributes(m.group(3))
+                    size = int(attributes["size"], 0) if "size" in attributes else 0
+                    symbols.append(SymbolEntry(m.group(1), int(m.group(2), 0), size, attributes.get("type")))
+
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return lines, symbols
+
+
+def find_drift(hand: List[SymbolEntry], extracted: List[SymbolEntry]) -> List[str]:
+    """
+    Describe every hand-written entry that disagrees with the binary's symbol table.
+    """
+    by_name = {s.name: s for s in extracted}
+    by_vram = {s.vram: s for s in extracted}
+    drift = []
+    for sym in hand:
+        other = by_vram.get(sym.vram)
+        if sym.name in by_name and by_name[sym.name].vram != sym.vram:
+            drift.append(f"{sym.name} is at 0x{sym.vram:X} but the binary has it at 0x{by_name[sym.name].vram:X}")
+        elif other is not None and other.name != sym.name:
+            drift.append(f"{sym.name} at 0x{sym.vram:X} is named {other.name} in the binary")
+        if other is None:
+            continue
+        if sym.size and other.size and sym.size != other.size:
+            drift.append(f"{sym.name} has size 0x{sym.size:X} but the binary says 0x{other.size:X}")
+        if sym.type == "func" and other.type != "func":
+            drift.append(f"{sym.name} is marked as a function but the binary has an object there")
+    return drift
+
+
+def format_symbol(sym: SymbolEntry) -> str:
+    attributes = []
+    if sym.type:
+        attributes.append(f"type:{sym.type}")
+    if sym.size:
+        attributes.append(f"size:0x{sym.size:X}")
+    line = f"{sym.name} = 0x{sym.vram:08X};"
+    if attributes:
+        line += " // " + " ".join(attributes)
+    if sym.demangled:
+        line = f"// {sym.demangled}\n{line}"
+    return line
+
+
+def refresh(binary: Path, symbol_addrs: Path, cache_path: Path, write: bool = True) -> List[str]:
+    """
+    Regenerate the extracted block of symbol_addrs.txt, skipping names and addresses the
+    hand-written entries already define. Returns the drift found. The file is only
+    rewritten when its contents change, so splat and ninja don't see a spurious edit.
+    """
+    extracted = load_symbols(binary, cache_path)
+    lines, hand = read_symbol_addrs(symbol_addrs)
+
+    names = {s.name for s in hand}
+    addresses = {s.vram for s in hand}
+    generated = [format_symbol(s) for s in extracted if s.name not in names and s.vram not in addresses]
+
+    if write:
+        content = "\n".join(lines + ([""] if lines else []) + [BEGIN_MARKER] + generated + [END_MARKER]) + "\n"
+        if not symbol_addrs.exists() or symbol_addrs.read_text(encoding="utf-8") != content:
+            symbol_addrs.write_text(content, encoding="utf-8")
+
+    return find_drift(hand, extracted)
+
+#MARK: Main
+def main():
+    """
+    Main function, parses arguments, refreshes symbol_addrs.txt and reports drift.
+    """
+    parser = argparse.ArgumentParser(description="Extract symbols from the original binary into symbol_addrs.txt")
+    parser.add_argument("--binary", help="Original binary", type=Path, required=True)
+    parser.add_argument("--symbol-addrs", help="symbol_addrs.txt to refresh", type=Path, required=True)
+    parser.add_argument("--cache", help="Cache of the extracted symbols", type=Path, required=True)
+    parser.add_argument("--check", help="Only report drift, don't write symbol_addrs.txt", action="store_true")
+    parser.add_argument("--strict", help="Exit with an error if there is drift", action="store_true")
+    args = parser.parse_args()
+
+    drift = refresh(args.binary, args.symbol_addrs, args.cache, write=not args.check)
+    for message in drift:
+        print(f"symbol drift: {message}")
+    if drift and args.strict:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
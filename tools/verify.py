@@ -0,0 +1,253 @@
+"""
+Compare the built image against the original binary and report where they differ, by ELF
+section, by yaml segment, by linked object and by symbol. Both files are memory-mapped and
+compared in chunks, so a matching build is confirmed in a fraction of a second and only the
+differing chunks are inspected byte by byte.
+"""
+#! /usr/bin/env python3
+import argparse
+import bisect
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import yaml
+
+import elffile
+import mapfile
+
+#MARK: Constants
+CHUNK_SIZE = 1 << 16
+BLOCK_SIZE = 256
+MAX_RANGES = 4096
+
+#MARK: Diff
+def diff_ranges(target, built, max_ranges: int = MAX_RANGES) -> List[Tuple[int, int]]:
+    """
+    Return the [start, end) byte ranges where the two buffers differ, merged and sorted.
+    Ranges are exact at the edges; within a 256-byte block, equal bytes between two
+    differing ones are folded into the range. Bytes past the end of the shorter buffer
+    count as differing.
+    """
+    size = min(len(target), len(built))
+    ranges: List[Tuple[int, int]] = []
+
+    def add(start: int, end: int) -> None:
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+    for chunk in range(0, size, CHUNK_SIZE):
+        chunk_end = min(chunk + CHUNK_SIZE, size)
+        if target[chunk:chunk_end] == built[chunk:chunk_end]:
+            continue
+        for block in range(chunk, chunk_end, BLOCK_SIZE):
+            block_end = min(block + BLOCK_SIZE, chunk_end)
+            a = target[block:block_end]
+            b = built[block:block_end]
+            if a == b:
+                continue
+            first = 0
+            while a[first] == b[first]:
+                first += 1
+            last = len(a) - 1
+            while a[last] == b[last]:
+                last -= 1
+            add(block + first, block + last + 1)
+        if len(ranges) >= max_ranges:
+            return ranges[:max_ranges]
+
+    if len(target) != len(built):
+        add(size, max(len(target), len(built)))
+    return ranges
+
+#MARK: Attribution
+class Intervals:
+    """
+    Sorted, non-overlapping [start, end) intervals with a payload, for offset lookups.
+    """
+    def __init__(self, items: List[Tuple[int, int, Dict]]):
+        items = sorted(items, key=lambda item: item[0])
+        self.starts = [item[0] for item in items]
+        self.items = items
+
+    def find(self, offset: int) -> Optional[Dict]:
+        idx = bisect.bisect_right(self.starts, offset) - 1
+        if idx >= 0 and offset < self.items[idx][1]:
+            return self.items[idx][2]
+        return None
+
+    def overlapping(self, start: int, end: int) -> Iterator[Tuple[int, int, Dict]]:
+        """
+        Yield the part of [start, end) in each interval it overlaps, with that interval's payload.
+        """
+        idx = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        while idx < len(self.items) and self.items[idx][0] < end:
+            item_start, item_end, payload = self.items[idx]
+            if item_end > start:
+                yield max(start, item_start), min(end, item_end), payload
+            idx += 1
+
+
+def elf_sections(target) -> Intervals:
+    """
+    The original binary's sections, by file offset.
+    """
+    items = []
+    for section in elffile.read_sections(target):
+        if section.type in (elffile.SHT_NULL, elffile.SHT_NOBITS) or section.size == 0:
+            continue
+        items.append((section.offset, section.offset + section.size, {"name": section.name, "offset": section.offset, "size": section.size}))
+    return Intervals(items)
+
+
+def elf_symbols(target) -> Intervals:
+    """
+    The original binary's sized function and object symbols, by file offset.
+    """
+    sections = elffile.read_sections(target)
+    symtab = elffile.find_section(sections, ".symtab", elffile.SHT_SYMTAB)
+    items = []
+    if symtab is None:
+        return Intervals(items)
+    for sym in elffile.iter_symbols(target, sections, symtab):
+        if sym.type not in (elffile.STT_FUNC, elffile.STT_OBJECT) or sym.size == 0:
+            continue
+        if sym.shndx == elffile.SHN_UNDEF or sym.shndx >= len(sections):
+            continue
+        section = sections[sym.shndx]
+        if section.type == elffile.SHT_NOBITS:
+            continue
+        offset = section.offset + sym.value - section.addr
+        items.append((offset, offset + sym.size, {
+            "name": sym.name,
+            "type": elffile.SYMBOL_TYPES.get(sym.type, str(sym.type)),
+            "vram": sym.value,
+            "offset": offset,
+            "size": sym.size,
+        }))
+    return Intervals(items)
+
+
+def yaml_segments(yaml_path: Path) -> Intervals:
+    """
+    The leaf segments of the splat config, by rom offset.
+    """
+    with open(yaml_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    starts = []
+
+    def walk(segments) -> None:
+        for seg in segments:
+            if isinstance(seg, dict):
+                if seg.get("subsegments"):
+                    walk(seg["subsegments"])
+                elif "start" in seg:
+                    starts.append((seg["start"], seg.get("type"), seg.get("name")))
+            elif isinstance(seg, list) and seg:
+                starts.append((seg[0], seg[1] if len(seg) > 1 else None, seg[2] if len(seg) > 2 else None))
+
+    walk(config["segments"])
+    starts.sort(key=lambda s: s[0])
+    items = []
+    for (start, seg_type, name), (end, _, _) in zip(starts, starts[1:]):
+        if seg_type is not None and end > start:
+            items.append((start, end, {"name": name or f"{start:X}", "type": seg_type, "offset": start, "size": end - start}))
+    return Intervals(items)
+
+
+def map_objects(map_path: Path) -> Intervals:
+    """
+    The linked objects' input sections, by image offset.
+    """
+    items = []
+    for obj, sections in mapfile.object_sections(map_path).items():
+        for s in sections:
+            items.append((s.offset, s.offset + s.size, {"object": obj, "section": s.name, "offset": s.offset, "size": s.size, "vram": s.vma}))
+    return Intervals(items)
+
+#MARK: Report
+def verify(target_path: Path, built_path: Path, map_path: Optional[Path], yaml_path: Optional[Path]) -> Dict:
+    """
+    Compare the two files and build the report.
+    """
+    with elffile.open_mmap(target_path) as target, elffile.open_mmap(built_path) as built:
+        ranges = diff_ranges(target, built)
+        report = {
+            "target": str(target_path),
+            "built": str(built_path),
+            "match": not ranges,
+            "target_size": len(target),
+            "built_size": len(built),
+            "ranges_truncated": len(ranges) >= MAX_RANGES,
+            "sections": [],
+            "segments": [],
+            "objects": [],
+            "symbols": [],
+            "first_mismatch": None,
+        }
+        if not ranges:
+            return report
+
+        lookups = {"sections": elf_sections(target), "symbols": elf_symbols(target)}
+
+    if yaml_path is not None and yaml_path.exists():
+        lookups["segments"] = yaml_segments(yaml_path)
+    if map_path is not None and map_path.exists():
+        lookups["objects"] = map_objects(map_path)
+
+    # Group the differing ranges under each section/segment/object/symbol they overlap, split
+    # at their boundaries, so a long run of shifted code is credited to everything it covers
+    for key, intervals in lookups.items():
+        grouped: Dict[int, Dict] = {}
+        for start, end in ranges:
+            for part_start, part_end, item in intervals.overlapping(start, end):
+                entry = grouped.setdefault(id(item), dict(item, ranges=[]))
+                entry["ranges"].append([part_start, part_end])
+        report[key] = list(grouped.values())
+
+    start = ranges[0][0]
+    first = {"offset": start}
+    for key, label in (("sections", "section"), ("segments", "segment"), ("objects", "object"), ("symbols", "symbol")):
+        if key in lookups:
+            first[label] = lookups[key].find(start)
+    report["first_mismatch"] = first
+    return report
+
+
+def main():
+    """
+    Main function, parses arguments, verifies and writes the JSON report.
+    """
+    parser = argparse.ArgumentParser(description="Compare the built image against the original binary")
+    parser.add_argument("--target", help="Original binary", type=Path, required=True)
+    parser.add_argument("--built", help="Built image", type=Path, required=True)
+    parser.add_argument("--map", help="Linker map of the built image", type=Path)
+    parser.add_argument("--yaml", help="splat config with the segment table", type=Path)
+    parser.add_argument("-o", "--output", help="JSON report to write", type=Path)
+    parser.add_argument("--strict", help="Exit with an error if the files differ", action="store_true")
+    args = parser.parse_args()
+
+    report = verify(args.target, args.built, args.map, args.yaml)
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if report["match"]:
+        print(f"verify: {args.built} matches")
+        return
+
+    first = report["first_mismatch"]
+    symbol = first.get("symbol") or {}
+    where = symbol.get("name") or (first.get("segment") or {}).get("name") or "unknown"
+    print(f"verify: {args.built} differs at 0x{first['offset']:X} in {where} ({len(report['symbols'])} symbols differ)")
+    if args.strict:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()